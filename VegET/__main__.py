@@ -0,0 +1,5 @@
+import sys
+
+from VegET.cli import main
+
+sys.exit(main())
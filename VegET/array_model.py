@@ -0,0 +1,323 @@
+"""
+VegET daily water balance and temporal interpolation on in-memory arrays.
+
+These are the array counterparts of veg_et_model.vegET_model() and interpolate.daily(), with the same formulas
+and band names, written with numpy so they can be run on any block of a larger grid (see dask_backend.py).
+Bands are stacked along an axis in the order given by FORCING_BANDS, STATIC_BANDS, STATE_BANDS and the
+requested output bands:
+    forcing: (time, len(FORCING_BANDS), rows, cols)
+    statics: (len(STATIC_BANDS), rows, cols)
+    state: (len(STATE_BANDS), rows, cols)
+    outputs: (time, len(bands), rows, cols)
+Nodata is represented by NaN.
+
+VegET model code from G. Senay, S. Kagone, and M.Velpuri
+"""
+
+import numpy as np
+
+from . import interp_methods
+# Interpolation methods, see interp_methods.py
+from .interp_methods import INTERP_METHODS
+
+FORCING_BANDS = ('pr', 'eto', 'tminC', 'tmaxC', 'tmeanC', 'ndvi')
+STATIC_BANDS = ('intercept', 'whc', 'soil_sat', 'fcap')
+# Values carried from one day to the next
+STATE_BANDS = ('swf', 'snowpack')
+# NOTE: intercepted precip is the second 'intercept' band of the Earth Engine outputs (renamed 'intercept_1'
+#    by addMultiBands). It is named 'intppt' here.
+OUTPUT_BANDS = ('rain_frac', 'effppt', 'intppt', 'rain', 'swe', 'melt_rate', 'snowmelt', 'snowpack', 'swi',
+                'sat_fc', 'rf1', 'rf', 'srf', 'ddrain', 'etasw1A', 'etasw1B', 'etasw1', 'etasw2', 'etasw3',
+                'etasw4', 'etasw', 'swf1', 'bigswi', 'swf_thresh', 'swf')
+
+VARA = 1.25
+VARB = 0.2
+# Drainage coefficient
+DC_COEFF = 0.65
+RF_COEFF = 1.0 - DC_COEFF
+
+
+def stack(arrays, names, axis=0):
+    """
+    Stack a dict of single band arrays in band order
+    :param arrays: dict
+        Arrays keyed by band name
+    :param names: tuple of str
+        Band order, e.g., FORCING_BANDS
+    :param axis: int
+        Band axis of the stacked array
+    :return: np.ndarray
+    """
+    missing = [name for name in names if name not in arrays]
+    if missing:
+        raise ValueError('Missing band(s): {}'.format(', '.join(missing)))
+    return np.stack([np.asarray(arrays[name]) for name in names], axis=axis)
+
+
+def check_bands(bands):
+    """
+    Raise ValueError for band names that are not in OUTPUT_BANDS
+    """
+    unknown = [b for b in bands if b not in OUTPUT_BANDS]
+    if unknown:
+        raise ValueError('Unknown output band(s): {}'.format(', '.join(unknown)))
+
+
+def check_shapes(forcing_shape, statics_shape):
+    """
+    Raise ValueError if forcing and statics arrays do not have the expected band stacks and grid
+    :param forcing_shape: tuple of int
+        Shape of the forcing array
+    :param statics_shape: tuple of int
+        Shape of the statics array
+    """
+    if len(forcing_shape) != 4 or forcing_shape[1] != len(FORCING_BANDS):
+        raise ValueError('forcing: expected shape (time, {}, rows, cols) with bands {}, got {}'.format(
+            len(FORCING_BANDS), FORCING_BANDS, forcing_shape))
+    if tuple(statics_shape) != (len(STATIC_BANDS),) + tuple(forcing_shape[2:]):
+        raise ValueError('statics: expected shape {} with bands {}, got {}'.format(
+            (len(STATIC_BANDS),) + tuple(forcing_shape[2:]), STATIC_BANDS, statics_shape))
+
+
+def init_state(forcing_day, statics):
+    """
+    Initial state for the first model day. See veg_et_model.init_image_create().
+    :param forcing_day: np.ndarray
+        Forcing for the first day, (len(FORCING_BANDS), rows, cols)
+    :param statics: np.ndarray
+        (len(STATIC_BANDS), rows, cols)
+    :return: np.ndarray
+        (len(STATE_BANDS), rows, cols)
+    """
+    pr = forcing_day[FORCING_BANDS.index('pr')]
+    intercept = statics[STATIC_BANDS.index('intercept')]
+    whc = statics[STATIC_BANDS.index('whc')]
+
+    effppt = pr * (1 - (intercept / 100))
+    swf = whc * 0.5 * effppt
+    snowpack = np.zeros_like(swf)
+    return np.stack([swf, snowpack])
+
+
+def is_snow_free(tmean, tmin, tmax, melt_rate=None, snowpack_free=True):
+    """
+    Check whether the snow module can be skipped for a day: all precip falls as rain (tmean >= 12), there is
+    no snowpack and the melt rate is not negative, so swe, snow melt and snowpack are all zero. Without the
+    melt rate, it is taken as non-negative if tmax >= 0 and tmax >= tmin. Nodata pixels are ignored.
+    :param tmean: np.ndarray
+    :param tmin: np.ndarray
+    :param tmax: np.ndarray
+    :param melt_rate: np.ndarray, optional
+        Melt rate for the day, if it has been computed
+    :param snowpack_free: bool
+        Whether the snowpack from the previous day is zero or nodata everywhere
+    :return: bool
+    """
+    # fmin.reduce() is np.nanmin() without the warning for blocks that are all nodata
+    if not snowpack_free or np.fmin.reduce(tmean, axis=None) < 12.0:
+        return False
+    if melt_rate is not None:
+        return not np.fmin.reduce(melt_rate, axis=None) < 0.0
+    return not (np.fmin.reduce(tmax, axis=None) < 0.0 or np.any(tmax < tmin))
+
+
+def daily_step(state, forcing_day, statics, bands=OUTPUT_BANDS, snow_fast_path=True, snowpack_free=None):
+    """
+    One day of the water balance. See daily_vegET_calc() in veg_et_model.vegET_model().
+    :param state: np.ndarray
+        Previous day state, (len(STATE_BANDS), rows, cols)
+    :param forcing_day: np.ndarray
+        (len(FORCING_BANDS), rows, cols)
+    :param statics: np.ndarray
+        (len(STATIC_BANDS), rows, cols)
+    :param bands: tuple of str
+        Output bands that will be used
+    :param snow_fast_path: bool
+        Skip the snow computations on snow free days (see is_snow_free()). The results are the same.
+    :param snowpack_free: bool, optional
+        Whether the snowpack in state is zero or nodata everywhere, from the 'snowpack_free' of the previous
+        day's results. Checked on the state if not given.
+    :return: dict
+        Arrays for every band in OUTPUT_BANDS, and 'snowpack_free' for the new snowpack. On snow free days
+        melt_rate is None unless it is in bands.
+    """
+    pr, eto, tmin, tmax, tmean, ndvi = forcing_day
+    intercept, whc, soil_sat, fcap = statics
+    prev_swf, prev_snowpack = state
+
+    melt_rate = None
+    snow_free = False
+    if snow_fast_path:
+        if snowpack_free is None:
+            snowpack_free = not np.any(prev_snowpack > 0.0)
+        if 'melt_rate' in bands:
+            melt_rate = 0.06 * ((tmax * tmax) - (tmax * tmin))
+        snow_free = is_snow_free(tmean, tmin, tmax, melt_rate, snowpack_free)
+
+    effppt = pr * (1 - (intercept / 100))
+    intppt = pr * (intercept / 100)
+
+    if snow_free:
+        # All rain, keep nodata pixels as nodata
+        rain_frac = np.where(np.isnan(tmean), np.nan, 1.0)
+        rain = rain_frac * effppt
+        swe = (1.0 - rain_frac) * effppt
+        # swe and the previous snowpack are zero or nodata, so is their sum: no snow melt and no snowpack
+        snowmelt = swe + prev_snowpack
+        snowpack = snowmelt
+        snowpack_free = True
+    else:
+        rain_frac = np.where(tmean <= 6.0, 0.0, np.where(tmean < 12.0, tmean * 0.0833, 1.0))
+        # where() drops NaN from the conditions, keep nodata pixels as nodata
+        rain_frac = np.where(np.isnan(tmean), np.nan, rain_frac)
+        rain = rain_frac * effppt
+        swe = (1.0 - rain_frac) * effppt
+
+        if melt_rate is None:
+            melt_rate = 0.06 * ((tmax * tmax) - (tmax * tmin))
+        available = swe + prev_snowpack
+        snowmelt = np.where(melt_rate <= available, melt_rate, available)
+        snwpk1 = prev_snowpack + swe - snowmelt
+        snowpack = np.where(snwpk1 < 0.0, 0.0, snwpk1)
+        snowpack_free = snow_fast_path and not np.any(snwpk1 > 0.0)
+
+    swi = prev_swf + rain + snowmelt
+    sat_fc = soil_sat - fcap
+    rf1 = swi - whc
+    rf = np.where(rf1 < 0.0, 0.0, rf1)
+    srf = np.where(rf <= sat_fc, rf * RF_COEFF, (rf - sat_fc) + RF_COEFF * sat_fc)
+    ddrain = rf - srf
+
+    etasw1A = (ndvi * VARA + VARB) * eto
+    etasw1B = ndvi * VARA * eto
+    # If ndvi is > 0.4, use etasw1A, otherwise, use etasw1B
+    etasw1 = np.where(ndvi > 0.4, etasw1A, etasw1B)
+    half_whc = whc * 0.5
+    with np.errstate(divide='ignore', invalid='ignore'):
+        etasw2 = etasw1 * (swi / half_whc)
+    etasw3 = np.where(swi > half_whc, etasw1, etasw2)
+    etasw4 = np.where(etasw3 > swi, swi, etasw3)
+    etasw = np.where(etasw4 > whc, whc, etasw4)
+
+    swf1 = swi - etasw
+    bigswi = whc - etasw
+    swf_thresh = np.where(swf1 < 0.0, 0.0, swf1)
+    swf = np.where(swi > whc, bigswi, swf_thresh)
+
+    return {
+        'rain_frac': rain_frac, 'effppt': effppt, 'intppt': intppt, 'rain': rain, 'swe': swe,
+        'melt_rate': melt_rate, 'snowmelt': snowmelt, 'snowpack': snowpack, 'swi': swi, 'sat_fc': sat_fc,
+        'rf1': rf1, 'rf': rf, 'srf': srf, 'ddrain': ddrain, 'etasw1A': etasw1A, 'etasw1B': etasw1B,
+        'etasw1': etasw1, 'etasw2': etasw2, 'etasw3': etasw3, 'etasw4': etasw4, 'etasw': etasw,
+        'swf1': swf1, 'bigswi': bigswi, 'swf_thresh': swf_thresh, 'swf': swf, 'snowpack_free': snowpack_free,
+    }
+
+
+def vegET_model(forcing, statics, state=None, bands=OUTPUT_BANDS, dtype=np.float64, out=None, snow_fast_path=True):
+    """
+    Run the daily water balance over a block of days
+    :param forcing: np.ndarray
+        (time, len(FORCING_BANDS), rows, cols)
+    :param statics: np.ndarray
+        (len(STATIC_BANDS), rows, cols)
+    :param state: np.ndarray, optional
+        State before the first day, (len(STATE_BANDS), rows, cols). Computed with init_state() if not given.
+    :param bands: tuple of str
+        Output bands from OUTPUT_BANDS
+    :param dtype: numpy dtype
+        Precision of the computation and outputs
+    :param out: np.ndarray, optional
+        Array to write the outputs to, (time, len(bands), rows, cols)
+    :param snow_fast_path: bool
+        Skip the snow computations on days the block is snow free. See daily_step().
+    :return: tuple of np.ndarray (outputs, state)
+        Outputs (time, len(bands), rows, cols) and the state after the last day
+    """
+    bands = tuple(bands)
+    check_bands(bands)
+    forcing = np.asarray(forcing, dtype=dtype)
+    statics = np.asarray(statics, dtype=dtype)
+    n_days = forcing.shape[0]
+
+    if state is None:
+        state = init_state(forcing[0], statics)
+    state = np.asarray(state, dtype=dtype)
+
+    if out is None:
+        out = np.empty((n_days, len(bands)) + forcing.shape[2:], dtype=dtype)
+
+    snowpack_free = None
+    for day in range(n_days):
+        results = daily_step(state, forcing[day], statics, bands, snow_fast_path, snowpack_free)
+        snowpack_free = results['snowpack_free']
+        for i, band in enumerate(bands):
+            out[day, i] = results[band]
+        state = np.stack([results[band] for band in STATE_BANDS]).astype(dtype, copy=False)
+
+    return out, state
+
+
+def interp_daily(target_days, source_days, source_values, interp_days=16, interp_method='linear'):
+    """
+    Interpolate source images to target days. See interpolate.daily().
+    :param target_days: array of int
+        Day numbers (e.g., days since 1970-01-01) of the target images
+    :param source_days: array of int
+        Day numbers of the source images, (n_source,)
+    :param source_values: np.ndarray
+        Source images, (n_source, ...). NaN pixels are nodata.
+    :param interp_days: int
+        The number of days before / after a target day to search for source values
+    :param interp_method: str
+        Name of a method in INTERP_METHODS (see interp_methods.register_method())
+    :return: np.ndarray
+        (n_target, ...) interpolated values
+    """
+    if interp_method.lower() not in INTERP_METHODS:
+        raise ValueError('Unknown interp_method {!r}, expected one of {}'.format(
+            interp_method, sorted(INTERP_METHODS)))
+    interp_func = INTERP_METHODS[interp_method.lower()].array
+
+    target_days = np.asarray(target_days)
+    source_days = np.asarray(source_days)
+    source_values = np.asarray(source_values, dtype=np.float64)
+    order = np.argsort(source_days, kind='stable')
+    source_days = source_days[order]
+    source_values = source_values[order]
+
+    out = np.empty((len(target_days),) + source_values.shape[1:], dtype=np.float64)
+    nodata = np.full(source_values.shape[1:], np.nan)
+
+    for i, day in enumerate(target_days):
+        # Closest valid value on / before the previous day, and on / after the target day
+        prev_value, prev_time = nodata.copy(), nodata.copy()
+        for s in np.flatnonzero((source_days >= day - interp_days) & (source_days < day)):
+            valid = ~np.isnan(source_values[s])
+            prev_value = np.where(valid, source_values[s], prev_value)
+            prev_time = np.where(valid, source_days[s], prev_time)
+        next_value, next_time = nodata.copy(), nodata.copy()
+        for s in np.flatnonzero((source_days >= day) & (source_days < day + interp_days + 1))[::-1]:
+            valid = ~np.isnan(source_values[s])
+            next_value = np.where(valid, source_values[s], next_value)
+            next_time = np.where(valid, source_days[s], next_time)
+
+        # Fill missing values with values from the opposite side
+        prev_missing = np.isnan(prev_value)
+        next_missing = np.isnan(next_value)
+        prev_value = np.where(prev_missing, next_value, prev_value)
+        prev_time = np.where(prev_missing, next_time, prev_time)
+        next_value = np.where(next_missing, prev_value, next_value)
+        next_time = np.where(next_missing, prev_time, next_time)
+
+        # Earth Engine image division returns 0 for division by 0
+        span = next_time - prev_time
+        with np.errstate(divide='ignore', invalid='ignore'):
+            time_ratio = np.where(span == 0, 0.0, (day - prev_time) / span)
+
+        # Source images the method may use, e.g., the smoothing spline fits all of them
+        window = (source_days >= day - interp_days) & (source_days <= day + interp_days)
+        out[i] = interp_func(interp_methods.InterpWindow(
+            source_values[window], source_days[window], day, prev_value, next_value, prev_time, next_time,
+            time_ratio))
+
+    return out
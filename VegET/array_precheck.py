@@ -0,0 +1,97 @@
+"""
+Input checks for the array backends (dask, shm), the counterpart of precheck.py for runs on zarr arrays.
+
+Forcing length, band stacks and grid shapes, and the overlap of a coarse forcing grid with the model grid only
+use array metadata and the grid mapping the run uses anyway (see resample.config_mapping()). Static nodata
+fractions read the statics one tile at a time.
+
+VegET model code from G. Senay, S. Kagone, and M.Velpuri
+"""
+
+import datetime
+
+import numpy as np
+
+from . import array_model, resample
+
+
+def _run_days(dates):
+    """
+    Number of days in the run dates (end is the day after the last day)
+    """
+    start = datetime.datetime.strptime(dates['start'], '%Y-%m-%d')
+    end = datetime.datetime.strptime(dates['end'], '%Y-%m-%d')
+    return (end - start).days
+
+
+def _nodata_fractions(statics, tile_size):
+    """
+    Fraction of nodata (NaN) pixels in each band of the statics, read one tile at a time
+    :param statics: array-like
+        (band, rows, cols), e.g., a zarr array
+    :param tile_size: int
+    :return: np.ndarray
+        (band,)
+    """
+    n_bands, n_rows, n_cols = statics.shape
+    counts = np.zeros(n_bands)
+    for row in range(0, n_rows, tile_size):
+        for col in range(0, n_cols, tile_size):
+            counts += np.isnan(np.asarray(statics[:, row:row + tile_size, col:col + tile_size])).sum(axis=(1, 2))
+    return counts / max(n_rows * n_cols, 1)
+
+
+def check(cfg):
+    """
+    Check the input arrays of an array backend run before any model computation is scheduled
+    :param cfg: dict
+        Validated run configuration with an array backend
+    :return: list of str
+        Problems found. Empty if all checks passed.
+    """
+    import zarr
+
+    checks = cfg['checks']
+    arrays = cfg['arrays']
+
+    try:
+        forcing = zarr.open_array(arrays['forcing'], mode='r')
+        statics = zarr.open_array(arrays['statics'], mode='r')
+    except (OSError, ValueError) as e:
+        return ['Unable to read the input arrays: {}'.format(e)]
+
+    problems = []
+    if checks['dates']:
+        # Array runs have one forcing step per day of the run
+        n_days = _run_days(cfg['dates'])
+        if forcing.shape[0] != n_days:
+            problems.append('arrays.forcing ({}): {} days of forcing, the run dates {} to {} need {}'.format(
+                arrays['forcing'], forcing.shape[0], cfg['dates']['start'], cfg['dates']['end'], n_days))
+
+    mapping = None
+    if checks['bands'] or checks['extent']:
+        try:
+            if len(forcing.shape) == 4 and len(statics.shape) == 3:
+                mapping = resample.config_mapping(arrays, cfg['inputs']['resample'], forcing.shape, statics.shape)
+            grid_shape = tuple(forcing.shape[2:]) if mapping is None else tuple(statics.shape[1:])
+            if checks['bands']:
+                array_model.check_shapes(tuple(forcing.shape[:2]) + grid_shape, statics.shape)
+        except (ImportError, ValueError) as e:
+            problems.append('arrays ({}, {}): {}'.format(arrays['forcing'], arrays['statics'], e))
+
+    if checks['extent'] and mapping is not None:
+        outside = 1.0 - np.mean(mapping.valid)
+        if outside == 1.0:
+            problems.append('arrays.forcing_grid: does not overlap the model grid')
+        elif outside > checks['max_nodata_fraction']:
+            problems.append('arrays.forcing_grid: {:.0%} of the model grid is outside the forcing (max {:.0%})'.format(
+                outside, checks['max_nodata_fraction']))
+
+    if checks['nodata'] and len(statics.shape) == 3:
+        fractions = _nodata_fractions(statics, cfg['tiling']['tile_size'])
+        for name, nodata in zip(array_model.STATIC_BANDS, fractions):
+            if nodata > checks['max_nodata_fraction']:
+                problems.append('arrays.statics ({}): {:.0%} of band {} is nodata (max {:.0%})'.format(
+                    arrays['statics'], nodata, name, checks['max_nodata_fraction']))
+
+    return problems
@@ -0,0 +1,273 @@
+"""
+Chunk size tuning for the array backends.
+
+calibrate() runs the daily water balance on sample tiles of a few sizes and measures throughput (seconds per
+pixel-day) and working memory (bytes per pixel). choose() uses the measurements to pick the tile size, time
+window length and worker count with the shortest estimated run time that fits a memory budget. tune_config()
+does both for a run configuration; the returned plan is recorded in the run metadata (see run_metadata()) so
+a run can be reproduced with the same settings.
+
+VegET model code from G. Senay, S. Kagone, and M.Velpuri
+"""
+
+import os
+import platform
+import time
+import tracemalloc
+
+import numpy as np
+
+from . import array_model, resample
+from .config import parse_bytes
+
+# Tile sizes tried by calibrate() (clipped to the grid)
+TILE_SIZES = (64, 128, 256, 512, 1024, 2048)
+# Days run for each calibration tile
+CALIBRATION_DAYS = 4
+# Headroom on the estimated memory use (dask copies, allocator overhead, ...)
+SAFETY_FACTOR = 1.5
+# Shortest time window considered before falling back to a smaller tile
+MIN_TIME_CHUNK = 8
+
+
+def _sample(forcing, statics, tile_size, n_days, mapping=None):
+    """
+    Top left tile of the inputs, as in-memory numpy arrays. Forcing is resampled to the model grid if a mapping
+    is given.
+    """
+    statics = np.asarray(statics[:, :tile_size, :tile_size])
+    if mapping is None:
+        forcing = np.asarray(forcing[:n_days, :, :tile_size, :tile_size])
+    else:
+        tile_mapping, src_rows, src_cols = resample.window_mapping(mapping, slice(0, tile_size), slice(0, tile_size))
+        forcing = resample.apply_mapping(tile_mapping, forcing[:n_days, :, src_rows, src_cols])
+    return forcing, statics
+
+
+def calibrate(forcing, statics, bands=array_model.OUTPUT_BANDS, tile_sizes=TILE_SIZES, n_days=CALIBRATION_DAYS,
+              dtype=np.float64, mapping=None, memory_budget=None):
+    """
+    Measure the throughput and working memory of the daily water balance on sample tiles
+    :param forcing: array-like
+        (time, len(FORCING_BANDS), rows, cols). Sample tiles are read from the top left of the grid, so
+        zarr or dask arrays are only partly read.
+    :param statics: array-like
+        (len(STATIC_BANDS), rows, cols)
+    :param bands: tuple of str
+        Output bands of the run
+    :param tile_sizes: tuple of int
+        Tile sizes to measure. Sizes larger than the grid are clipped to it.
+    :param n_days: int
+        Number of days to run for each tile
+    :param dtype: numpy dtype
+    :param mapping: resample.GridMapping, optional
+        Mapping from the forcing grid to the model (statics) grid, if the forcing is not on the model grid
+    :param memory_budget: int, str, optional
+        Memory available to the run. Tile sizes whose calibration run would not fit are not measured.
+    :return: list of dict
+        One entry per measured tile size with 'tile_size', 'seconds_per_pixel_day' and 'work_bytes_per_pixel'
+    """
+    bands = tuple(bands)
+    array_model.check_bands(bands)
+    grid_edge = max(statics.shape[1:])
+    n_days = min(n_days, forcing.shape[0])
+
+    itemsize = np.dtype(dtype).itemsize
+    memory_budget = parse_bytes(memory_budget) if memory_budget is not None else None
+
+    results = []
+    for tile_size in sorted(set(min(size, grid_edge) for size in tile_sizes)):
+        if memory_budget is not None and _calibration_bytes(tile_size, n_days, len(bands), itemsize) > memory_budget:
+            continue
+        tile_forcing, tile_statics = _sample(forcing, statics, tile_size, n_days, mapping)
+        tile_forcing = tile_forcing.astype(dtype, copy=False)
+        tile_statics = tile_statics.astype(dtype, copy=False)
+        n_pixels = tile_forcing.shape[2] * tile_forcing.shape[3]
+        out = np.empty((n_days, len(bands)) + tile_forcing.shape[2:], dtype=dtype)
+
+        # Warm up, then time without memory tracing (tracemalloc slows allocations down)
+        array_model.vegET_model(tile_forcing[:1], tile_statics, bands=bands, dtype=dtype, out=out[:1])
+        start = time.perf_counter()
+        array_model.vegET_model(tile_forcing, tile_statics, bands=bands, dtype=dtype, out=out)
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        try:
+            array_model.vegET_model(tile_forcing[:1], tile_statics, bands=bands, dtype=dtype, out=out[:1])
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        results.append({
+            'tile_size': tile_size,
+            'seconds_per_pixel_day': elapsed / (n_pixels * n_days),
+            'work_bytes_per_pixel': peak / n_pixels,
+        })
+    return results
+
+
+def _calibration_bytes(tile_size, n_days, n_bands, itemsize):
+    """
+    Estimated memory of a calibration run, before its working memory is measured: the sample inputs and outputs,
+    and daily step temporaries of one array per output band
+    """
+    sample = n_days * _bytes_per_day(tile_size, n_bands, itemsize)
+    return sample + _fixed_bytes(tile_size, len(array_model.OUTPUT_BANDS) * itemsize, itemsize)
+
+
+def _forcing_copies(neighbors):
+    """
+    Forcing sized arrays held per tile: the forcing, and one gathered neighbor while it is resampled (see
+    resample.apply_mapping())
+    """
+    return 2 if neighbors else 1
+
+
+def _copy_bytes(tile_size, n_days, n_bands, itemsize, neighbors=0):
+    """
+    Estimated memory of copying one tile of all days into or out of shared memory (shm backend)
+    """
+    per_pixel = n_days * max(len(array_model.FORCING_BANDS) * _forcing_copies(neighbors), n_bands) * itemsize
+    return SAFETY_FACTOR * tile_size * tile_size * per_pixel
+
+
+def _bytes_per_day(tile_size, n_bands, itemsize, neighbors=0):
+    """
+    Estimated memory per day of time window for one tile: forcing (and its resampling) and outputs
+    """
+    n_arrays = len(array_model.FORCING_BANDS) * _forcing_copies(neighbors) + n_bands
+    return SAFETY_FACTOR * tile_size * tile_size * n_arrays * itemsize
+
+
+def _fixed_bytes(tile_size, work_bytes_per_pixel, itemsize):
+    """
+    Estimated memory for one tile independent of the time window: statics, state and daily step temporaries
+    """
+    per_pixel = (len(array_model.STATIC_BANDS) + 2 * len(array_model.STATE_BANDS)) * itemsize + work_bytes_per_pixel
+    return SAFETY_FACTOR * tile_size * tile_size * per_pixel
+
+
+def choose(calibration, grid_shape, n_days, n_bands, memory_budget, max_workers=None, backend='dask',
+           dtype=np.float64, neighbors=0):
+    """
+    Pick tile size, time window length and worker count for a run
+    :param calibration: list of dict
+        Output of calibrate()
+    :param grid_shape: tuple of int
+        (rows, cols) of the run grid
+    :param n_days: int
+        Number of days in the run
+    :param n_bands: int
+        Number of output bands
+    :param memory_budget: int, str
+        Memory available to the run, in bytes or e.g. '16GB'
+    :param max_workers: int, optional
+        Largest number of workers (default is the number of cores)
+    :param backend: {'dask', 'shm'}
+        'shm' keeps the whole run in shared memory and does not split it into time windows
+    :param dtype: numpy dtype
+    :param neighbors: int
+        Source pixels per model pixel if the forcing is resampled to the model grid (resample.GridMapping.index),
+        0 if the forcing is on the model grid
+    :return: dict
+        Plan with 'tile_size', 'time_chunk', 'workers', 'estimated_seconds' and 'estimated_bytes'
+    """
+    memory_budget = parse_bytes(memory_budget)
+    max_workers = max_workers or os.cpu_count() or 1
+    itemsize = np.dtype(dtype).itemsize
+    n_pixels = grid_shape[0] * grid_shape[1]
+
+    # Inputs and outputs of the whole run are held in shared memory by the shm backend
+    shared_bytes = 0
+    if backend == 'shm':
+        shared_bytes = n_pixels * itemsize * (n_days * (len(array_model.FORCING_BANDS) + n_bands) +
+                                              len(array_model.STATIC_BANDS))
+
+    best = None
+    for entry in calibration:
+        tile_size = entry['tile_size']
+        n_tiles = -(-grid_shape[0] // tile_size) * -(-grid_shape[1] // tile_size)
+        # The shm backend fills and drains the shared arrays one tile (of all days) at a time
+        copy_bytes = _copy_bytes(tile_size, n_days, n_bands, itemsize, neighbors) if backend == 'shm' else 0
+        for workers in range(min(max_workers, n_tiles), 0, -1):
+            per_worker = (memory_budget - shared_bytes - copy_bytes) / workers
+            fixed = _fixed_bytes(tile_size, entry['work_bytes_per_pixel'], itemsize)
+            if backend == 'shm':
+                # Forcing and outputs are already counted in shared_bytes
+                time_chunk = n_days
+                worker_bytes = fixed
+                fits = fixed <= per_worker
+            else:
+                # Largest time window that fits, up to the whole run
+                per_day = _bytes_per_day(tile_size, n_bands, itemsize, neighbors)
+                time_chunk = int(min(n_days, (per_worker - fixed) // per_day)) if per_worker > fixed else 0
+                worker_bytes = fixed + time_chunk * per_day
+                fits = time_chunk >= min(MIN_TIME_CHUNK, n_days)
+            if not fits:
+                continue
+
+            # Tiles are run in rounds of one tile per worker
+            rounds = -(-n_tiles // workers)
+            estimated_seconds = rounds * tile_size * tile_size * n_days * entry['seconds_per_pixel_day']
+            plan = {
+                'tile_size': tile_size,
+                'time_chunk': time_chunk,
+                'workers': workers,
+                'estimated_seconds': estimated_seconds,
+                'estimated_bytes': int(shared_bytes + copy_bytes + workers * worker_bytes),
+            }
+            # Prefer faster plans, then fewer time windows
+            key = (estimated_seconds, -time_chunk)
+            if best is None or key < best[0]:
+                best = (key, plan)
+            break
+
+    if best is None:
+        raise ValueError('No tile size fits the memory budget of {} bytes; increase tiling.memory_budget'.format(
+            memory_budget))
+    return best[1]
+
+
+def tune_config(cfg, forcing, statics, mapping=None):
+    """
+    Calibrate on the run inputs and pick tiling settings for a run configuration
+    :param cfg: dict
+        Validated run configuration with an array backend and tiling.memory_budget set
+    :param forcing: array-like
+        (time, len(FORCING_BANDS), rows, cols)
+    :param statics: array-like
+        (len(STATIC_BANDS), rows, cols)
+    :param mapping: resample.GridMapping, optional
+        Mapping from the forcing grid to the model (statics) grid, if the forcing is not on the model grid
+    :return: tuple (dict, dict)
+        Run configuration with tiling.tile_size, tiling.time_chunk and workers set from the plan, and the plan
+        with its calibration measurements
+    """
+    bands = tuple(cfg['outputs']['bands'])
+    calibration = calibrate(forcing, statics, bands, mapping=mapping, memory_budget=cfg['tiling']['memory_budget'])
+    plan = choose(calibration, statics.shape[1:], forcing.shape[0], len(bands), cfg['tiling']['memory_budget'],
+                  cfg['workers'], cfg['backend'], neighbors=mapping.index.shape[1] if mapping is not None else 0)
+    plan['calibration'] = calibration
+
+    tuned = dict(cfg, tiling=dict(cfg['tiling'], tile_size=plan['tile_size'], time_chunk=plan['time_chunk']),
+                 workers=plan['workers'])
+    return tuned, plan
+
+
+def run_metadata(cfg, plan=None):
+    """
+    Metadata recorded with the outputs of an array backend run
+    :param cfg: dict
+        Run configuration used for the run
+    :param plan: dict, optional
+        Tuning plan from tune_config()
+    :return: dict
+    """
+    return {
+        'config': cfg,
+        'tuning': plan,
+        'numpy': np.__version__,
+        'python': platform.python_version(),
+        'host': platform.node(),
+        'cpu_count': os.cpu_count(),
+    }
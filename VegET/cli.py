@@ -0,0 +1,132 @@
+"""
+Command line interface for headless VegET runs.
+
+    python -m VegET run config.yaml
+    python -m VegET check config.yaml
+    python -m VegET validate config.yaml
+
+'run' checks the inputs (see precheck.py, and array_precheck.py for the array backends) before starting the
+model. 'check' only runs the input checks.
+
+See config.py for the run configuration settings.
+
+VegET model code from G. Senay, S. Kagone, and M.Velpuri
+"""
+
+import argparse
+import json
+import sys
+
+from VegET import config
+
+
+def _precheck(cfg):
+    """
+    Check the run inputs and report any problems
+    :param cfg: dict
+        Validated run configuration
+    :return: list of str
+        Problems found
+    """
+    if cfg['backend'] == 'ee':
+        from VegET import precheck, veg_et
+
+        problems = precheck.check(cfg, veg_et.region_geometry(cfg))
+    else:
+        from VegET import array_precheck
+
+        problems = array_precheck.check(cfg)
+    for problem in problems:
+        print('veget: {}'.format(problem), file=sys.stderr)
+    return problems
+
+
+def _check(cfg):
+    """
+    Run only the input checks
+    :param cfg: dict
+        Validated run configuration
+    :return: int
+        Exit status
+    """
+    if _precheck(cfg):
+        return 1
+    print('All input checks passed')
+    return 0
+
+
+def _run(cfg):
+    """
+    Run the model with the backend named in the configuration
+    :param cfg: dict
+        Validated run configuration
+    :return: int
+        Exit status
+    """
+    if _precheck(cfg):
+        return 1
+    # Backends are imported here so validation does not need Earth Engine credentials
+    if cfg['backend'] == 'ee':
+        from VegET import veg_et
+
+        vegET_run, polygon = veg_et.run(cfg)
+        tasks = veg_et.export(vegET_run, cfg, polygon)
+        for task in tasks:
+            print('Started export task {} ({})'.format(task.id, task.config.get('description', '')))
+    elif cfg['backend'] == 'dask':
+        from VegET import dask_backend
+
+        dask_backend.run_config(cfg)
+        print('Wrote outputs to {}'.format(cfg['outputs']['path']))
+    elif cfg['backend'] == 'shm':
+        from VegET import shm_executor
+
+        shm_executor.run_config(cfg)
+        print('Wrote outputs to {}'.format(cfg['outputs']['path']))
+    return 0
+
+
+def main(argv=None):
+    """
+    Entry point for the veget command
+    :param argv: list of str, optional
+        Command line arguments (default sys.argv[1:])
+    :return: int
+        Exit status
+    """
+    parser = argparse.ArgumentParser(prog='veget', description='Run the VegET daily ET model')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    run_parser = subparsers.add_parser('run', help='Validate a configuration and run the model')
+    run_parser.add_argument('config', help='YAML run configuration')
+
+    check_parser = subparsers.add_parser('check', help='Validate a configuration and check the run inputs')
+    check_parser.add_argument('config', help='YAML run configuration')
+
+    validate_parser = subparsers.add_parser('validate', help='Validate a configuration and print it with defaults')
+    validate_parser.add_argument('config', help='YAML run configuration')
+
+    args = parser.parse_args(argv)
+
+    try:
+        cfg = config.load(args.config)
+    except (OSError, config.ConfigError) as e:
+        print('veget: {}'.format(e), file=sys.stderr)
+        return 2
+
+    if args.command == 'validate':
+        print(json.dumps(cfg, indent=2))
+        return 0
+    if args.command == 'check':
+        return _check(cfg)
+    try:
+        return _run(cfg)
+    except (OSError, ValueError) as e:
+        # Missing or unreadable input arrays, or problems with their shapes or the tiling settings
+        print('veget: {}'.format(e), file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
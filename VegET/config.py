@@ -0,0 +1,335 @@
+"""
+Run configuration for headless VegET runs (see cli.py).
+
+A run is described by a YAML file with sections for the region, dates, inputs, outputs, backend, tiling
+and worker count. SCHEMA documents every setting; load() reads a file and validate() checks it and fills
+in defaults. Defaults reproduce the original interactive veg_et.py run.
+
+Example:
+    region:
+      polygon: [[-109.05, 37.0], [-102.05, 37.0], [-102.05, 41.0], [-109.05, 41.0]]
+    dates:
+      start: 2003-04-01
+      end: 2003-11-01
+    outputs:
+      destination: drive
+      path: vegET_runs
+
+VegET model code from G. Senay, S. Kagone, and M.Velpuri
+"""
+
+import datetime
+import os
+from collections import namedtuple
+
+# type: python type(s) accepted, required: must be given by the user, default: used when not given,
+#    choices: allowed values (None for any), doc: description of the setting
+Field = namedtuple('Field', ['type', 'required', 'default', 'choices', 'doc'])
+
+BACKENDS = ('ee', 'dask', 'shm')
+# Bands of the daily images returned by veg_et_model.vegET_model(): the daily inputs, followed by the model bands.
+#    Intercepted precip is 'intercept_1' since addMultiBands() renames it after the static 'intercept' band.
+#    Array backends use array_model.OUTPUT_BANDS instead.
+EE_OUTPUT_BANDS = ('ndvi', 'intercept', 'whc', 'soil_sat', 'fcap', 'pr', 'eto', 'tminC', 'tmaxC', 'tmeanC', 'time',
+                   'rain_frac', 'effppt', 'intercept_1', 'rain', 'swe', 'melt_rate', 'snowmelt', 'snowpack', 'swi',
+                   'sat_fc', 'rf1', 'rf', 'srf', 'ddrain', 'etasw1A', 'etasw1B', 'etasw1', 'etasw2', 'etasw3',
+                   'etasw4', 'etasw', 'swf1', 'bigswi', 'swf_thresh', 'swf')
+SCHEDULERS = ('threads', 'processes', 'distributed')
+DESTINATIONS = ('drive', 'asset')
+
+SCHEMA = {
+    'region': {
+        'polygon': Field(list, False, None, None,
+                         'List of [lon, lat] vertices of the region of interest'),
+        'asset': Field(str, False, None, None,
+                       'Earth Engine FeatureCollection asset id used instead of polygon'),
+    },
+    'dates': {
+        'start': Field((str, datetime.date), True, None, None, 'First day of the run (YYYY-MM-DD)'),
+        'end': Field((str, datetime.date), True, None, None, 'Day after the last day of the run (YYYY-MM-DD)'),
+        'season_begin': Field(int, False, 4, tuple(range(1, 13)), 'First growing season month (inclusive)'),
+        'season_end': Field(int, False, 10, tuple(range(1, 13)),
+                            'Last growing season month (inclusive). Can be before season_begin for seasons that '
+                            'wrap around the new year, e.g., 11 to 3'),
+    },
+    'inputs': {
+        'ndvi': Field(str, False, 'MODIS/006/MOD09Q1', None, 'Surface reflectance collection used for NDVI'),
+        'climate': Field(str, False, 'IDAHO_EPSCOR/GRIDMET', None, 'Daily climate collection (pr, eto, tmmn, tmmx)'),
+        'interp_days': Field(int, False, 16, None, 'Days searched before / after each day for NDVI'),
+        'interp_method': Field(str, False, 'linear', None,
+                               'NDVI interpolation method: nearest, linear, smoothstep, spline or any method '
+                               'registered with interp_methods.register_method()'),
+        'resample': Field(str, False, 'bilinear', ('nearest', 'bilinear'),
+                          'Resampling of climate forcing to the NDVI grid'),
+        'intercept': Field(str, False, 'users/darin_EE/VegET/Interception', None, 'Canopy interception image'),
+        'whc': Field(str, False, 'users/darin_EE/VegET/WaterHoldingCapacity_mm', None,
+                     'Soil water holding capacity image'),
+        'soil_sat': Field(str, False, 'users/darin_EE/VegET/SoilSaturation_mm', None, 'Soil saturation image'),
+        'fcap': Field(str, False, 'users/darin_EE/VegET/FieldCapacity_mm', None, 'Field capacity image'),
+    },
+    'outputs': {
+        'bands': Field(list, False, ['swf', 'etasw', 'snowpack', 'srf', 'ddrain'], None, 'Model bands to export'),
+        'destination': Field(str, False, 'drive', DESTINATIONS, 'Export to Google Drive or Earth Engine assets'),
+        'path': Field(str, True, None, None,
+                      'Drive folder or asset id prefix for the exports, or zarr store for array backends'),
+        'scale': Field((int, float), False, 250, None, 'Export pixel size in meters'),
+    },
+    'arrays': {
+        'forcing': Field(str, False, None, None,
+                         'zarr array (time, band, rows, cols) of daily forcing for array backends. Bands are '
+                         'pr, eto, tminC, tmaxC, tmeanC, ndvi (see array_model.FORCING_BANDS)'),
+        'statics': Field(str, False, None, None,
+                         'zarr array (band, rows, cols) of static grids for array backends. Bands are '
+                         'intercept, whc, soil_sat, fcap (see array_model.STATIC_BANDS)'),
+        'grid': Field(list, False, None, None,
+                      'Model grid of the statics array as [x0, dx, y0, dy]: upper left corner and pixel sizes '
+                      '(dy is negative for north-up grids). Required with forcing_grid.'),
+        'forcing_grid': Field(list, False, None, None,
+                              'Grid of the forcing array as [x0, dx, y0, dy], if it is not on the model grid '
+                              '(e.g., 4 km GRIDMET). Forcing is resampled to the model grid with inputs.resample.'),
+        'crs': Field(str, False, None, None, 'CRS of the model grid, e.g., EPSG:5070'),
+        'forcing_crs': Field(str, False, None, None,
+                             'CRS of the forcing grid if it differs from crs (requires pyproj)'),
+    },
+    'backend': Field(str, False, 'ee', BACKENDS, 'Compute backend'),
+    'tiling': {
+        'tile_size': Field(int, False, 512, None, 'Tile edge length in pixels for tiled backends'),
+        'time_chunk': Field(int, False, 32, None,
+                            'Days per time window for the dask backend. Only one window of outputs is held in '
+                            'memory at a time.'),
+        'auto': Field(bool, False, False, None,
+                      'Pick tile_size, time_chunk and workers (up to workers) by calibrating on the inputs. '
+                      'Requires memory_budget.'),
+        'memory_budget': Field((str, int), False, None, None, 'Memory available to the run, e.g., 16GB'),
+    },
+    'dask': {
+        'scheduler': Field(str, False, 'threads', SCHEDULERS, 'Dask scheduler'),
+        'spill_dir': Field(str, False, None, None, 'Directory distributed workers spill to'),
+        'memory_limit': Field((str, int), False, 'auto', None, 'Memory limit per distributed worker, e.g., 4GB'),
+    },
+    'workers': Field(int, False, None, None,
+                     'Number of parallel workers for tiled backends (default is 1, or the number of cores when '
+                     'tiling.auto is set)'),
+    'checks': {
+        'dates': Field(bool, False, True, None,
+                       'Check the climate and NDVI collections cover the run dates, padded by interp_days'),
+        'extent': Field(bool, False, True, None,
+                        'Check the region overlaps the input collections and static images'),
+        'bands': Field(bool, False, True, None, 'Check the input collections have the required bands'),
+        'nodata': Field(bool, False, True, None, 'Check the nodata fraction of the static images over the region'),
+        'max_nodata_fraction': Field((int, float), False, 0.5, None,
+                                     'Largest allowed nodata fraction of a static image over the region'),
+    },
+}
+
+
+# Memory size units accepted by parse_bytes()
+_UNITS = {'B': 1, 'KB': 10 ** 3, 'MB': 10 ** 6, 'GB': 10 ** 9, 'TB': 10 ** 12,
+          'KIB': 2 ** 10, 'MIB': 2 ** 20, 'GIB': 2 ** 30, 'TIB': 2 ** 40}
+
+
+class ConfigError(ValueError):
+    """Invalid run configuration"""
+
+
+def parse_bytes(value):
+    """
+    Convert a memory size such as '16GB' or '512MiB' to bytes
+    :param value: str, int
+    :return: int
+    """
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = value.strip().upper().replace(' ', '')
+    for unit in sorted(_UNITS, key=len, reverse=True):
+        if text.endswith(unit):
+            number = text[:-len(unit)]
+            break
+    else:
+        unit, number = 'B', text
+    try:
+        return int(float(number) * _UNITS[unit])
+    except ValueError:
+        raise ValueError('Invalid memory size {!r}, expected e.g. 16GB'.format(value))
+
+
+def _check_field(name, field, value):
+    """
+    Check a single setting against its Field
+    :param name: str
+        Dotted setting name for error messages
+    :param field: Field
+    :param value: setting value
+    :return: value
+    """
+    # bool is a subclass of int, don't accept True for an int setting
+    if isinstance(value, bool) and field.type is not bool:
+        raise ConfigError('{}: expected {}, got {!r}'.format(name, field.type, value))
+    if not isinstance(value, field.type):
+        raise ConfigError('{}: expected {}, got {!r}'.format(name, field.type, value))
+    if field.choices is not None and value not in field.choices:
+        raise ConfigError('{}: {!r} is not one of {}'.format(name, value, list(field.choices)))
+    return value
+
+
+def _apply_schema(schema, config, prefix=''):
+    """
+    Recursively check a config section against a schema section and fill in defaults
+    :param schema: dict
+    :param config: dict
+    :param prefix: str
+        Dotted name of the section for error messages
+    :return: dict
+    """
+    if not isinstance(config, dict):
+        raise ConfigError('{}: expected a mapping, got {!r}'.format(prefix.rstrip('.') or 'config', config))
+
+    unknown = set(config) - set(schema)
+    if unknown:
+        raise ConfigError('Unknown setting(s): {}'.format(', '.join(prefix + k for k in sorted(unknown))))
+
+    checked = {}
+    for key, spec in schema.items():
+        name = prefix + key
+        if isinstance(spec, dict):
+            checked[key] = _apply_schema(spec, config.get(key) or {}, name + '.')
+        elif key in config and config[key] is not None:
+            checked[key] = _check_field(name, spec, config[key])
+        elif spec.required:
+            raise ConfigError('{}: required setting is missing'.format(name))
+        else:
+            checked[key] = list(spec.default) if isinstance(spec.default, list) else spec.default
+    return checked
+
+
+def _check_memory_size(name, value):
+    """
+    Raise ConfigError if a memory size setting can not be parsed or is not positive
+    """
+    try:
+        size = parse_bytes(value)
+    except ValueError as e:
+        raise ConfigError('{}: {}'.format(name, e))
+    if size <= 0:
+        raise ConfigError('{}: must be positive, got {!r}'.format(name, value))
+
+
+def _parse_date(name, value):
+    """
+    Normalize a date setting to a YYYY-MM-DD string
+    """
+    if isinstance(value, datetime.date):
+        return value.strftime('%Y-%m-%d')
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        raise ConfigError('{}: expected a YYYY-MM-DD date, got {!r}'.format(name, value))
+
+
+def validate(config):
+    """
+    Check a run configuration and fill in defaults
+    :param config: dict
+        Configuration, e.g., as read from a YAML file
+    :return: dict
+        Validated configuration with all settings present
+    """
+    config = _apply_schema(SCHEMA, config)
+
+    region = config['region']
+    if config['backend'] == 'ee' and (region['polygon'] is None) == (region['asset'] is None):
+        raise ConfigError('region: exactly one of polygon or asset is required')
+    if region['polygon'] is not None:
+        vertices = region['polygon']
+        if len(vertices) < 3:
+            raise ConfigError('region.polygon: at least 3 vertices are required')
+        for vertex in vertices:
+            if not (isinstance(vertex, (list, tuple)) and len(vertex) == 2 and
+                    all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in vertex)):
+                raise ConfigError('region.polygon: expected [lon, lat] pairs, got {!r}'.format(vertex))
+            if not (-180 <= vertex[0] <= 180 and -90 <= vertex[1] <= 90):
+                raise ConfigError('region.polygon: vertex {!r} is outside lon/lat bounds'.format(vertex))
+
+    dates = config['dates']
+    dates['start'] = _parse_date('dates.start', dates['start'])
+    dates['end'] = _parse_date('dates.end', dates['end'])
+    if dates['start'] >= dates['end']:
+        raise ConfigError('dates: start {} must be before end {}'.format(dates['start'], dates['end']))
+
+    if config['inputs']['interp_days'] < 1:
+        raise ConfigError('inputs.interp_days: must be at least 1')
+    # Choices come from the registry, so registered plugins can be selected
+    from VegET import interp_methods
+    if config['inputs']['interp_method'].lower() not in interp_methods.INTERP_METHODS:
+        raise ConfigError('inputs.interp_method: {!r} is not one of {}'.format(
+            config['inputs']['interp_method'], sorted(interp_methods.INTERP_METHODS)))
+    if not config['outputs']['bands'] or not all(isinstance(b, str) for b in config['outputs']['bands']):
+        raise ConfigError('outputs.bands: expected a non-empty list of band names')
+    if config['backend'] == 'ee':
+        valid_bands = EE_OUTPUT_BANDS
+    else:
+        from VegET import array_model
+        valid_bands = array_model.OUTPUT_BANDS
+    unknown = [b for b in config['outputs']['bands'] if b not in valid_bands]
+    if unknown:
+        raise ConfigError('outputs.bands: unknown band(s) {} for the {} backend, expected any of {}'.format(
+            ', '.join(unknown), config['backend'], ', '.join(valid_bands)))
+    if config['outputs']['scale'] <= 0:
+        raise ConfigError('outputs.scale: must be positive')
+    if config['tiling']['tile_size'] < 1:
+        raise ConfigError('tiling.tile_size: must be at least 1')
+    if not 0 <= config['checks']['max_nodata_fraction'] <= 1:
+        raise ConfigError('checks.max_nodata_fraction: must be between 0 and 1')
+    if config['tiling']['time_chunk'] is not None and config['tiling']['time_chunk'] < 1:
+        raise ConfigError('tiling.time_chunk: must be at least 1')
+    if config['tiling']['auto']:
+        if config['backend'] == 'ee':
+            raise ConfigError('tiling.auto: only available for array backends')
+        if config['tiling']['memory_budget'] is None:
+            raise ConfigError('tiling.memory_budget: required when tiling.auto is set')
+    if config['tiling']['memory_budget'] is not None:
+        _check_memory_size('tiling.memory_budget', config['tiling']['memory_budget'])
+    if config['dask']['memory_limit'] != 'auto':
+        _check_memory_size('dask.memory_limit', config['dask']['memory_limit'])
+    if config['backend'] != 'ee':
+        for key in ('forcing', 'statics'):
+            if config['arrays'][key] is None:
+                raise ConfigError('arrays.{}: required for the {} backend'.format(key, config['backend']))
+    arrays = config['arrays']
+    for key in ('grid', 'forcing_grid'):
+        grid = arrays[key]
+        if grid is not None and not (len(grid) == 4 and all(
+                isinstance(v, (int, float)) and not isinstance(v, bool) for v in grid) and grid[1] and grid[3]):
+            raise ConfigError('arrays.{}: expected [x0, dx, y0, dy] with non-zero pixel sizes, got {!r}'.format(
+                key, grid))
+    if arrays['forcing_grid'] is not None and arrays['grid'] is None:
+        raise ConfigError('arrays.grid: required when arrays.forcing_grid is set')
+    if arrays['forcing_crs'] is not None and arrays['crs'] is None:
+        raise ConfigError('arrays.crs: required when arrays.forcing_crs is set')
+    if config['workers'] is None:
+        # Autotuning picks the worker count, up to the number of cores
+        config['workers'] = (os.cpu_count() or 1) if config['tiling']['auto'] else 1
+    if config['workers'] < 1:
+        raise ConfigError('workers: must be at least 1')
+
+    return config
+
+
+def load(path):
+    """
+    Read and validate a YAML run configuration
+    :param path: str
+        Path to the YAML file
+    :return: dict
+        Validated configuration
+    """
+    import yaml
+
+    with open(path) as f:
+        try:
+            config = yaml.safe_load(f)
+        except yaml.YAMLError as e:
+            raise ConfigError('{} is not valid YAML: {}'.format(path, e))
+    if config is None:
+        raise ConfigError('{} is empty'.format(path))
+    return validate(config)
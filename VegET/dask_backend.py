@@ -0,0 +1,337 @@
+"""
+Dask backend for grids that do not fit in memory.
+
+The daily water balance (array_model.vegET_model()) and the temporal interpolation (array_model.interp_daily())
+are mapped over spatial chunks of lazy dask arrays. The time loop stays sequential inside each chunk, but every
+spatial chunk advances independently and in parallel. run() can split a run into time windows, carrying the
+model state from one window to the next, and writes each window to a zarr store so only one window is held in
+memory at a time.
+
+Schedulers (see scheduler()):
+    'threads': local thread pool
+    'processes': local process pool
+    'distributed': local dask.distributed cluster. Workers spill to disk (spill_dir) when they reach their
+        memory limit.
+
+Requires dask (and zarr for stores): pip install "dask[array,distributed]" zarr
+
+VegET model code from G. Senay, S. Kagone, and M.Velpuri
+"""
+
+import contextlib
+
+import numpy as np
+
+from . import array_model, config, resample
+
+SCHEDULERS = ('threads', 'processes', 'distributed')
+
+# Days per time window of run(). Outputs of a whole window are computed before they are stored, so an unbounded
+#    window would hold the full (time, band, rows, cols) output in memory.
+DEFAULT_TIME_CHUNK = 32
+
+
+def _import_dask():
+    try:
+        import dask
+        import dask.array as da
+    except ImportError:
+        raise ImportError('The dask backend requires dask: pip install "dask[array,distributed]"')
+    return dask, da
+
+
+@contextlib.contextmanager
+def scheduler(name='threads', workers=None, spill_dir=None, memory_limit='auto'):
+    """
+    Context manager that sets the dask scheduler for computations run inside it
+    :param name: {'threads', 'processes', 'distributed'}
+    :param workers: int, optional
+        Number of threads / processes / cluster workers (default is the number of cores)
+    :param spill_dir: str, optional
+        Directory distributed workers spill to
+    :param memory_limit: str, int
+        Memory limit per distributed worker before spilling, e.g., '4GB'
+    :return: dask.distributed.Client for 'distributed', otherwise None
+    """
+    dask = _import_dask()[0]
+    if name not in SCHEDULERS:
+        raise ValueError('Unknown scheduler {!r}, expected one of {}'.format(name, SCHEDULERS))
+
+    if name == 'distributed':
+        from dask.distributed import Client, LocalCluster
+
+        with LocalCluster(n_workers=workers, threads_per_worker=1, local_directory=spill_dir,
+                          memory_limit=memory_limit) as cluster, Client(cluster) as client:
+            yield client
+    else:
+        with dask.config.set(scheduler=name, num_workers=workers):
+            yield None
+
+
+def _init_block(forcing, statics, precision):
+    """
+    Initial state of one spatial chunk from its first forcing day
+    """
+    return array_model.init_state(forcing[0], statics).astype(precision, copy=False)
+
+
+def _model_block(forcing, statics, state, bands, precision):
+    """
+    Run the water balance over all days of one spatial chunk. Returns only the outputs.
+    """
+    return array_model.vegET_model(forcing, statics, state, bands, precision)[0]
+
+
+def _interp_block(source_values, target_days, source_days, interp_days, interp_method):
+    """
+    Interpolate one spatial chunk
+    """
+    return array_model.interp_daily(target_days, source_days, source_values, interp_days, interp_method)
+
+
+def _spatial_chunks(array, tile_size, n_lead):
+    """
+    Chunk an array into tile_size spatial chunks, keeping the n_lead leading dimensions in one chunk
+    """
+    return array.rechunk((-1,) * n_lead + (tile_size, tile_size))
+
+
+def init_state(forcing, statics, tile_size=512, dtype=np.float64):
+    """
+    Lazy initial model state. See array_model.init_state().
+    :param forcing: array-like
+        (time, len(FORCING_BANDS), rows, cols)
+    :param statics: array-like
+        (len(STATIC_BANDS), rows, cols)
+    :param tile_size: int
+        Spatial chunk size
+    :param dtype: numpy dtype
+    :return: dask.array.Array
+        (len(STATE_BANDS), rows, cols)
+    """
+    da = _import_dask()[1]
+    first_day = _spatial_chunks(da.asarray(forcing)[:1], tile_size, 2)
+    statics = _spatial_chunks(da.asarray(statics), tile_size, 1)
+    return da.blockwise(_init_block, 'zyx', first_day, 'tbyx', statics, 'syx',
+                        new_axes={'z': len(array_model.STATE_BANDS)}, concatenate=True,
+                        dtype=dtype, meta=np.empty((0, 0, 0), dtype=dtype), precision=dtype)
+
+
+def vegET_model(forcing, statics, state=None, bands=array_model.OUTPUT_BANDS, tile_size=512, dtype=np.float64):
+    """
+    Lazy daily water balance. See array_model.vegET_model().
+    :param forcing: array-like
+        (time, len(FORCING_BANDS), rows, cols), e.g., numpy, zarr or dask array
+    :param statics: array-like
+        (len(STATIC_BANDS), rows, cols)
+    :param state: array-like, optional
+        State before the first day, (len(STATE_BANDS), rows, cols). Computed with init_state() if not given.
+    :param bands: tuple of str
+        Output bands from array_model.OUTPUT_BANDS
+    :param tile_size: int
+        Spatial chunk size
+    :param dtype: numpy dtype
+        Precision of the computation and outputs
+    :return: tuple of dask.array.Array (outputs, state)
+        Outputs (time, len(bands), rows, cols) and the state after the last day
+    """
+    da = _import_dask()[1]
+    bands = tuple(bands)
+    # The state bands are always computed so the state after the last day can be returned
+    run_bands = bands + tuple(b for b in array_model.STATE_BANDS if b not in bands)
+
+    if state is None:
+        state = init_state(forcing, statics, tile_size, dtype)
+    forcing = _spatial_chunks(da.asarray(forcing), tile_size, 2)
+    statics = _spatial_chunks(da.asarray(statics), tile_size, 1)
+    state = _spatial_chunks(da.asarray(state), tile_size, 1)
+
+    outputs = da.blockwise(_model_block, 'tcyx', forcing, 'tbyx', statics, 'syx', state, 'zyx',
+                           new_axes={'c': len(run_bands)}, concatenate=True,
+                           dtype=dtype, meta=np.empty((0, 0, 0, 0), dtype=dtype),
+                           bands=run_bands, precision=dtype)
+
+    new_state = outputs[-1][[run_bands.index(b) for b in array_model.STATE_BANDS]]
+    return outputs[:, :len(bands)], new_state
+
+
+def interp_daily(target_days, source_days, source_values, interp_days=16, interp_method='linear', tile_size=512):
+    """
+    Lazy temporal interpolation. See array_model.interp_daily().
+    :param target_days: array of int
+        Day numbers of the target images
+    :param source_days: array of int
+        Day numbers of the source images
+    :param source_values: array-like
+        Source images, (n_source, ..., rows, cols). NaN pixels are nodata.
+    :param interp_days: int
+    :param interp_method: str
+        Name of a method in array_model.INTERP_METHODS
+    :param tile_size: int
+        Spatial chunk size
+    :return: dask.array.Array
+        (n_target, ..., rows, cols)
+    """
+    da = _import_dask()[1]
+    if interp_method.lower() not in array_model.INTERP_METHODS:
+        raise ValueError('Unknown interp_method {!r}, expected one of {}'.format(
+            interp_method, sorted(array_model.INTERP_METHODS)))
+
+    target_days = np.asarray(target_days)
+    source_values = da.asarray(source_values)
+    source_values = _spatial_chunks(source_values, tile_size, source_values.ndim - 2)
+
+    return source_values.map_blocks(
+        _interp_block, chunks=((len(target_days),),) + source_values.chunks[1:], dtype=np.float64,
+        meta=np.empty((0,) * source_values.ndim), target_days=target_days, source_days=np.asarray(source_days),
+        interp_days=interp_days, interp_method=interp_method)
+
+
+def _resample_block(forcing, mapping, days, src_rows, src_cols):
+    """
+    Read the source window of one tile and time window, and resample it to the tile
+    """
+    return resample.apply_mapping(mapping, forcing[days, :, src_rows, src_cols])
+
+
+def resample_forcing(forcing, mapping, tile_size=512, time_chunk=DEFAULT_TIME_CHUNK):
+    """
+    Lazy resampling of forcing to the target grid of a mapping (see resample.grid_mapping()). Every chunk reads
+    only the source pixels its tile needs.
+    :param forcing: array-like
+        (time, band, rows, cols) on mapping.src, e.g., a zarr array
+    :param mapping: resample.GridMapping
+    :param tile_size: int
+        Spatial chunk size
+    :param time_chunk: int, optional
+        Days per chunk. None reads all days in one chunk.
+    :return: dask.array.Array
+        (time, band, rows, cols) on mapping.dst
+    """
+    dask, da = _import_dask()
+    n_days, n_bands = forcing.shape[:2]
+    dst = mapping.dst
+    row_tiles = [slice(r, min(r + tile_size, dst.rows)) for r in range(0, dst.rows, tile_size)]
+    col_tiles = [slice(c, min(c + tile_size, dst.cols)) for c in range(0, dst.cols, tile_size)]
+    source = dask.delayed(forcing, pure=True)
+
+    def _tile(rows, cols):
+        tile_mapping, src_rows, src_cols = resample.window_mapping(mapping, rows, cols)
+        shape = (n_bands, rows.stop - rows.start, cols.stop - cols.start)
+        return da.concatenate([
+            da.from_delayed(dask.delayed(_resample_block, pure=True)(source, tile_mapping, slice(start, end),
+                                                                      src_rows, src_cols),
+                            shape=(end - start,) + shape, dtype=np.float64, meta=np.empty((0, 0, 0, 0)))
+            for start, end in _time_windows(n_days, time_chunk)])
+
+    # Tiles are assembled along the last two (rows, cols) dimensions
+    return da.block([[_tile(rows, cols) for cols in col_tiles] for rows in row_tiles])
+
+
+def _time_windows(n_days, time_chunk):
+    """
+    (start, end) day index pairs of the time windows of a run
+    """
+    time_chunk = time_chunk or n_days
+    return [(start, min(start + time_chunk, n_days)) for start in range(0, n_days, time_chunk)]
+
+
+def run(forcing, statics, bands=array_model.OUTPUT_BANDS, tile_size=512, time_chunk=DEFAULT_TIME_CHUNK, store=None,
+        dtype=np.float64):
+    """
+    Run the daily water balance window by window with the current dask scheduler (see scheduler())
+    :param forcing: array-like
+        (time, len(FORCING_BANDS), rows, cols)
+    :param statics: array-like
+        (len(STATIC_BANDS), rows, cols)
+    :param bands: tuple of str
+        Output bands from array_model.OUTPUT_BANDS
+    :param tile_size: int
+        Spatial chunk size
+    :param time_chunk: int, optional
+        Number of days per time window. None runs the whole run in one window.
+    :param store: str, optional
+        Path of a zarr group. Outputs are written to its 'outputs' array (time, band, rows, cols) and the
+        state after the last window to its 'state' array. If not given, outputs are returned in memory.
+    :param dtype: numpy dtype
+        Precision of the computation and outputs
+    :return: np.ndarray or zarr.Array
+        Outputs (time, len(bands), rows, cols)
+    """
+    dask, da = _import_dask()
+    bands = tuple(bands)
+    array_model.check_bands(bands)
+    forcing = da.asarray(forcing)
+    n_days = forcing.shape[0]
+    grid_shape = forcing.shape[2:]
+    windows = _time_windows(n_days, time_chunk)
+
+    if store is None:
+        outputs = np.empty((n_days, len(bands)) + grid_shape, dtype=dtype)
+    else:
+        import zarr
+
+        chunks = (windows[0][1] - windows[0][0], len(bands), tile_size, tile_size)
+        outputs = zarr.open_array('{}/outputs'.format(store), mode='w', shape=(n_days, len(bands)) + grid_shape,
+                                  chunks=chunks, dtype=dtype)
+        outputs.attrs['bands'] = list(bands)
+        state_store = zarr.open_array('{}/state'.format(store), mode='w',
+                                      shape=(len(array_model.STATE_BANDS),) + grid_shape,
+                                      chunks=(len(array_model.STATE_BANDS), tile_size, tile_size), dtype=dtype)
+        state_store.attrs['bands'] = list(array_model.STATE_BANDS)
+
+    state = None
+    for start, end in windows:
+        window_out, window_state = vegET_model(forcing[start:end], statics, state, bands, tile_size, dtype)
+        if store is None:
+            outputs[start:end], state = dask.compute(window_out, window_state)
+        else:
+            # Outputs and state come from the same tasks, so they are stored in one pass. The next window
+            #    reads the state back from the store instead of recomputing this window.
+            da.store([window_out, window_state], [outputs, state_store],
+                     regions=[(slice(start, end),), (slice(None),)])
+            state = da.from_zarr(state_store)
+
+    return outputs
+
+
+def run_config(cfg):
+    """
+    Run the dask backend for a run configuration (see config.py). Forcing on a coarser grid (arrays.forcing_grid)
+    is resampled to the model grid. Tiling is tuned first if tiling.auto is set. The configuration used and any
+    tuning plan are recorded in the 'run' attribute of the outputs.
+    :param cfg: dict
+        Validated run configuration with backend 'dask'
+    :return: zarr.Array
+        Outputs written to cfg['outputs']['path']
+    """
+    import zarr
+
+    from . import autotune
+
+    da = _import_dask()[1]
+    statics = da.from_zarr(cfg['arrays']['statics'])
+    forcing = zarr.open_array(cfg['arrays']['forcing'], mode='r')
+    # Coarse forcing is resampled to the model grid with the cached mapping for the grid pair
+    mapping = resample.config_mapping(cfg['arrays'], cfg['inputs']['resample'], forcing.shape, statics.shape)
+    grid_shape = forcing.shape[2:] if mapping is None else statics.shape[1:]
+    array_model.check_shapes(forcing.shape[:2] + grid_shape, statics.shape)
+
+    plan = None
+    memory_limit = cfg['dask']['memory_limit']
+    if cfg['tiling']['auto']:
+        # Tuned on the zarr forcing, so calibration only reads (and resamples) its sample tiles
+        cfg, plan = autotune.tune_config(cfg, forcing, statics, mapping)
+        if memory_limit == 'auto':
+            memory_limit = config.parse_bytes(cfg['tiling']['memory_budget']) // cfg['workers']
+
+    if mapping is None:
+        forcing = da.from_zarr(forcing)
+    else:
+        forcing = resample_forcing(forcing, mapping, cfg['tiling']['tile_size'], cfg['tiling']['time_chunk'])
+
+    with scheduler(cfg['dask']['scheduler'], cfg['workers'], cfg['dask']['spill_dir'], memory_limit):
+        outputs = run(forcing, statics, cfg['outputs']['bands'], cfg['tiling']['tile_size'],
+                      cfg['tiling']['time_chunk'], cfg['outputs']['path'])
+    outputs.attrs['run'] = autotune.run_metadata(cfg, plan)
+    return outputs
@@ -0,0 +1,282 @@
+"""
+Temporal interpolation methods shared by the Earth Engine (interpolate.daily()) and array
+(array_model.interp_daily()) implementations.
+
+Every method is registered with an Earth Engine and an array implementation (see register_method()), so a
+method name selected in a run configuration works with every backend. Both implementations are called with
+an InterpWindow for one target date:
+    values: source images within interp_days of the target date, sorted by time
+    times: times of the source images
+    target_time: time of the target date
+    prev_value / next_value: closest valid values before / on or after the target date. A side without a
+        valid value is filled from the other side.
+    prev_time / next_time: times of prev_value / next_value
+    time_ratio: fraction of the interval between prev_time and next_time elapsed at the target date (0 if
+        prev_time == next_time)
+
+Earth Engine implementations get values as an ee.ImageCollection, times as an ee.List and target_time as
+an ee.Number (milliseconds since epoch), and the other fields as ee.Image. Array implementations get numpy
+arrays (source image axis first, NaN as nodata) and times as day numbers.
+
+VegET model code from G. Senay, S. Kagone, and M.Velpuri
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+InterpWindow = namedtuple('InterpWindow', ['values', 'times', 'target_time', 'prev_value', 'next_value',
+                                           'prev_time', 'next_time', 'time_ratio'])
+
+# Earth Engine and array implementations of a method
+InterpMethod = namedtuple('InterpMethod', ['ee', 'array'])
+
+DAY_MILLIS = 24 * 60 * 60 * 1000
+
+# Roughness penalty of the smoothing spline, in days^3. For 8-day source images the penalty is comparable
+#    to the fit to the source values, so noise in single images is damped but seasonal changes are kept.
+SPLINE_SMOOTHING = 64.0
+
+
+def _ee_nearest(window):
+    """
+    Nearest neighbor in time. Ties go to the next image.
+    """
+    return window.prev_value.where(window.time_ratio.gte(0.5), window.next_value)
+
+
+def _array_nearest(window):
+    """Nearest neighbor in time. Ties go to the next image."""
+    return np.where(window.time_ratio >= 0.5, window.next_value, window.prev_value)
+
+
+def _ee_linear(window):
+    """
+    Linear interpolation between the bracketing images
+    """
+    return window.next_value.subtract(window.prev_value).multiply(window.time_ratio).add(window.prev_value)
+
+
+def _array_linear(window):
+    """Linear interpolation between the bracketing images"""
+    return (window.next_value - window.prev_value) * window.time_ratio + window.prev_value
+
+
+def _ee_smoothstep(window):
+    """
+    Smoothstep (cubic easing) between the bracketing images. Only the two bracketing images are used, and the
+    slope is zero at every source date, so values plateau around each source image.
+    """
+    weight = window.time_ratio.multiply(window.time_ratio).multiply(window.time_ratio.multiply(-2.0).add(3.0))
+    return window.next_value.subtract(window.prev_value).multiply(weight).add(window.prev_value)
+
+
+def _array_smoothstep(window):
+    """Smoothstep (cubic easing) between the bracketing images"""
+    weight = window.time_ratio * window.time_ratio * (3.0 - 2.0 * window.time_ratio)
+    return (window.next_value - window.prev_value) * weight + window.prev_value
+
+
+def _spline_pad_times(target_time, times):
+    """
+    Day numbers of the zero weight knots added around a smoothing spline window: outside the window on both
+    sides, and a third one so every window has at least three knots. Natural splines are linear outside their
+    data, so the knots do not change the fit.
+    """
+    half_width = max([abs(t - target_time) for t in times] + [0]) + 1
+    return [target_time - half_width, target_time + half_width, target_time + 2 * half_width]
+
+
+def spline_coefficients(times, target_time, smoothing=SPLINE_SMOOTHING):
+    """
+    Smoothing spline penalty matrix and evaluation vector (Reinsch algorithm, see Green and Silverman, 1994,
+    Nonparametric Regression and Generalized Linear Models, ch. 2). With W the diagonal matrix of the
+    weights of the source values y, the fitted values at the knots are g = (W + penalty)^-1 W y and the spline
+    at target_time is evaluation . g.
+    :param times: array of float
+        Distinct, sorted knot times (at least 3)
+    :param target_time: float
+        Clipped to the knot range
+    :param smoothing: float
+        Roughness penalty in time units^3
+    :return: tuple of np.ndarray
+        penalty (n, n) and evaluation (n,)
+    """
+    t = np.asarray(times, dtype=np.float64)
+    n = len(t)
+    h = np.diff(t)
+    j = np.arange(n - 2)
+
+    # Q^T (second differences) and R (tridiagonal), for the interior knots
+    qt = np.zeros((n - 2, n))
+    qt[j, j] = 1.0 / h[:-1]
+    qt[j, j + 1] = -1.0 / h[:-1] - 1.0 / h[1:]
+    qt[j, j + 2] = 1.0 / h[1:]
+    r = np.zeros((n - 2, n - 2))
+    r[j, j] = (h[:-1] + h[1:]) / 3.0
+    r[j[:-1], j[:-1] + 1] = h[1:-1] / 6.0
+    r[j[:-1] + 1, j[:-1]] = h[1:-1] / 6.0
+
+    # Second derivatives at the knots are curvature . g (zero at the end knots)
+    curvature = np.zeros((n, n))
+    curvature[1:-1] = np.linalg.solve(r, qt)
+    penalty = smoothing * qt.T.dot(curvature[1:-1])
+
+    s = min(max(target_time, t[0]), t[-1])
+    i = min(max(int(np.searchsorted(t, s, side='right')) - 1, 0), n - 2)
+    left = s - t[i]
+    right = t[i + 1] - s
+    evaluation = np.zeros(n)
+    evaluation[i] += right / h[i]
+    evaluation[i + 1] += left / h[i]
+    evaluation -= left * right / 6.0 * ((1.0 + left / h[i]) * curvature[i + 1] + (1.0 + right / h[i]) * curvature[i])
+    return penalty, evaluation
+
+
+def _array_spline(window):
+    """
+    Cubic smoothing spline through the valid source values in the window. Pixels without a valid value on
+    both sides of the target date get the linear method's values.
+    """
+    out = _array_linear(window)
+    fit = (np.asarray(window.next_time) > np.asarray(window.prev_time)).ravel()
+    if not np.any(fit):
+        return out
+
+    times = list(window.times)
+    pad = _spline_pad_times(window.target_time, times)
+    penalty, evaluation = spline_coefficients(sorted(times + pad), window.target_time)
+    order = np.argsort(times + pad, kind='stable')
+    flat = np.asarray(window.values, dtype=np.float64).reshape(len(times), -1)
+    flat = np.concatenate([flat, np.full((len(pad), flat.shape[1]), np.nan)])[order]
+
+    weight = (~np.isnan(flat[:, fit])).astype(np.float64).T
+    system = penalty + weight[:, :, np.newaxis] * np.eye(len(order))
+    fitted = np.linalg.solve(system, (weight * np.nan_to_num(flat[:, fit].T))[:, :, np.newaxis])[:, :, 0]
+
+    out = np.array(out, dtype=np.float64)
+    out.reshape(-1)[fit] = fitted.dot(evaluation)
+    return out
+
+
+def _ee_spline_coefficients(times, target_time, smoothing):
+    """
+    Server side spline_coefficients()
+    :param times: ee.List
+        Distinct, sorted knot times in days (at least 3)
+    :param target_time: ee.Number
+        Target time in days, within the knot range
+    :param smoothing: float
+    :return: tuple of ee.Array
+        penalty (n, n) and evaluation (1, n)
+    """
+    import ee
+
+    times = ee.List(times)
+    n = times.size()
+    m = n.subtract(2)
+    h = ee.List.sequence(0, n.subtract(2)).map(
+        lambda k: ee.Number(times.get(ee.Number(k).add(1))).subtract(times.get(k)))
+    h_prev = h.slice(0, m)
+    h_next = h.slice(1)
+
+    def _diag(values):
+        # Square diagonal matrix from an ee.List
+        return ee.Array(ee.List(values).map(lambda v: ee.List([v]))).matrixToDiag()
+
+    identity = ee.Array.identity(n)
+    inv_prev = h_prev.map(lambda v: ee.Number(1.0).divide(v))
+    inv_next = h_next.map(lambda v: ee.Number(1.0).divide(v))
+    inv_sum = ee.List.sequence(0, m.subtract(1)).map(
+        lambda k: ee.Number(inv_prev.get(k)).add(inv_next.get(k)))
+    qt = _diag(inv_prev).matrixMultiply(identity.slice(0, 0, m)) \
+        .subtract(_diag(inv_sum).matrixMultiply(identity.slice(0, 1, m.add(1)))) \
+        .add(_diag(inv_next).matrixMultiply(identity.slice(0, 2, n)))
+
+    superdiag = identity.slice(0, 1, m.add(1)).slice(1, 0, m)
+    off_diag = _diag(h_next.map(lambda v: ee.Number(v).divide(6.0))).matrixMultiply(superdiag)
+    r = _diag(ee.List.sequence(0, m.subtract(1)).map(
+        lambda k: ee.Number(h_prev.get(k)).add(h_next.get(k)).divide(3.0))) \
+        .add(off_diag).add(off_diag.transpose())
+
+    zero_row = identity.slice(0, 0, 1).subtract(identity.slice(0, 0, 1))
+    interior = r.matrixSolve(qt)
+    curvature = ee.Array.cat([zero_row, interior, zero_row], 0)
+    penalty = qt.transpose().matrixMultiply(interior).multiply(smoothing)
+
+    i = times.filter(ee.Filter.lte('item', target_time)).size().subtract(1).max(0).min(n.subtract(2))
+    t_i = ee.Number(times.get(i))
+    h_i = ee.Number(h.get(i))
+    left = ee.Number(target_time).subtract(t_i)
+    right = h_i.subtract(left)
+    row_i = identity.slice(0, i, i.add(1))
+    row_next = identity.slice(0, i.add(1), i.add(2))
+    evaluation = row_i.multiply(right.divide(h_i)).add(row_next.multiply(left.divide(h_i))).subtract(
+        row_next.multiply(left.divide(h_i).add(1)).add(row_i.multiply(right.divide(h_i).add(1)))
+        .matrixMultiply(curvature).multiply(left.multiply(right).divide(6.0)))
+    return penalty, evaluation
+
+
+def _ee_spline(window):
+    """
+    Cubic smoothing spline through the valid source values in the window. Pixels without a valid value on
+    both sides of the target date get the linear method's values.
+    """
+    import ee
+
+    out = _ee_linear(window)
+    bands = window.prev_value.bandNames()
+
+    # Zero weight (fully masked) images at the padding knots, as in spline_coefficients() for arrays
+    target_day = ee.Number(window.target_time).divide(DAY_MILLIS)
+    days = ee.List(window.times).map(lambda t: ee.Number(t).divide(DAY_MILLIS))
+    # 0 is appended so an empty window has a half width of 1 day
+    half_width = ee.Number(days.map(lambda d: ee.Number(d).subtract(target_day).abs()).add(0)
+                           .reduce(ee.Reducer.max())).add(1)
+    pad_days = ee.List([target_day.subtract(half_width), target_day.add(half_width),
+                        target_day.add(half_width.multiply(2))])
+    pad_coll = ee.ImageCollection(pad_days.map(
+        lambda d: ee.Image.constant(ee.List.repeat(0, bands.length())).double().rename(bands).updateMask(0)
+        .set({'day': d})))
+    window_coll = window.values.map(lambda image: ee.Image(image).set(
+        {'day': ee.Number(image.get('time_0utc')).divide(DAY_MILLIS)}))
+    window_coll = window_coll.merge(pad_coll).sort('day')
+
+    penalty, evaluation = _ee_spline_coefficients(window_coll.aggregate_array('day'), target_day,
+                                                  SPLINE_SMOOTHING)
+    penalty = ee.Image(penalty)
+    evaluation = ee.Image(evaluation)
+
+    def _fit_band(band):
+        band_coll = window_coll.select([band])
+        value = band_coll.map(lambda image: ee.Image(image).unmask(0)).toArray()
+        weight = band_coll.map(lambda image: ee.Image(image).mask().gt(0).double()).toArray()
+        fitted = penalty.add(weight.matrixToDiag()).matrixSolve(weight.multiply(value))
+        return evaluation.matrixMultiply(fitted).arrayGet([0, 0])
+
+    fit = ee.ImageCollection.fromImages(bands.map(_fit_band)).toBands().rename(bands)
+    return out.where(window.next_time.gt(window.prev_time), fit)
+
+
+# Interpolation methods, keyed by lower case method name
+INTERP_METHODS = {
+    'nearest': InterpMethod(_ee_nearest, _array_nearest),
+    'linear': InterpMethod(_ee_linear, _array_linear),
+    'smoothstep': InterpMethod(_ee_smoothstep, _array_smoothstep),
+    'spline': InterpMethod(_ee_spline, _array_spline),
+}
+
+
+def register_method(name, ee_func, array_func):
+    """
+    Register an interpolation method for interpolate.daily(), array_model.interp_daily() and run configurations
+    :param name: str
+        Method name (inputs.interp_method). Case insensitive.
+    :param ee_func: function
+        Called with an InterpWindow of Earth Engine objects and returns an ee.Image of interpolated values
+        with the same bands as window.prev_value
+    :param array_func: function
+        Called with an InterpWindow of numpy arrays and returns an array of interpolated values with the shape
+        of window.prev_value
+    """
+    INTERP_METHODS[name.lower()] = InterpMethod(ee_func, array_func)
@@ -1,11 +1,20 @@
 """
-Interpolation of one imageCollection (source_coll) to the time-step of another (target_coll).
+Interpolation of one or more imageCollections (source_coll) to the time-step of another (target_coll).
 Ex: Create daily ndvi from 8-day ndvi imageCollection by interpolating to time-steps from a daily
 imageCollection. This code is largely structured on the openet.core.interp.py description of
 linear interpolation as of 06.04.19
 
-The way this is currently written the source imageCollection (e.g., 8-day NDVI) must be a 'global'
-dataset. No processes are included for mosaicking multiple images together for dates. This could be
+Several source collections (e.g., 8-day NDVI and a dynamic canopy interception product) can be
+interpolated in the same pass over the target collection. All bands from the target images are
+retained in the output images.
+
+Interpolation methods are plugins registered in interp_methods.INTERP_METHODS (see register_method()).
+Each method receives an interp_methods.InterpWindow with the source images within interp_days of the
+target date, the bracketing 'previous' and 'next' value and time images, and the time ratio image of the
+target date between them, and returns the interpolated value image.
+
+The way this is currently written the source imageCollection(s) (e.g., 8-day NDVI) must be 'global'
+datasets. No processes are included for mosaicking multiple images together for dates. This could be
 added though, and openet.core.interp.py has methods for this that could be brought over.
 
 VegET model code from G. Senay, S. Kagone, and M.Velpuri
@@ -13,119 +22,173 @@ Openet code from openet (etdata.org) and (https://github.com/Open-ET)
 """
 
 from .utils import millis, date_0utc, add_date_band
+from .interp_methods import INTERP_METHODS, InterpWindow, register_method
 import ee
 
 
+def _as_list(value, length):
+    """
+    Repeat a scalar parameter for each source collection, or check a list parameter has one
+    entry per source collection.
+    """
+    if isinstance(value, (list, tuple)):
+        if len(value) != length:
+            raise ValueError('Expected {} values, one per source collection, got {}'.format(length, len(value)))
+        return list(value)
+    return [value] * length
+
+
 def daily(target_coll, source_coll, interp_days=16, interp_method='linear'):
     """NOTE: Largely copied from openet.core.utils.py from 06.04.19 pull, with docstring edits
 
-    Generate daily images from collection
+    Generate daily images from collection(s)
 
     :param target_coll: The imageCollection of daily images. This is used to set the time-stamps for
-        the interpolated images
-    :param source_coll: The imageCollection that will be interpolated to the time-step of the target_coll
+        the interpolated images. All bands of the target images are kept in the output images.
+    :param source_coll: The imageCollection, or list of imageCollections, that will be interpolated to the
+        time-step of the target_coll. Band names must be unique across the source collections.
     :param interp_days: The number of days after source_coll image to consider for values. This will be
         data source specific. Ex: for 8-day modis ndvi the inter_days would need to be at least 8.
-    :param interp_method: Strictly 'LINEAR' for now
+        Either a single value, or a list with one value per source collection.
+    :param interp_method: Name of a method in INTERP_METHODS ('nearest', 'linear', 'smoothstep' or 'spline').
+        Either a single name, or a list with one name per source collection.
 
     :return: ImageCollection of daily interpolated images
     """
 
-    source_coll = ee.ImageCollection(source_coll.map(add_date_band))
-
-    if interp_method.lower() == 'linear':
-        def _linear(image):
-            """
-            Linearly interpolate source images to target image time_start(s)
-
-            :param image: ee.Image, the first band in the image will be used as the 'target' image
-                and will be returned with the output image. This image comes from the target_coll.
-
-            :return: ee.Image of interpolated values with band name 'src'.
-
-            NOTES: the source_coll images must have a time band. This function is intended to be mapped over
-            an image collection and can take only one input parameter (i.e., an image from the target_coll)
-            """
-
-            # TODO: try to keep all bands from target_image if useful to do so
-            target_image = ee.Image(image).double()
-            target_date = ee.Date(image.get('system:time_start'))
-
-            # All filtering will be done based on 0 UTC dates
-            utc0_date = date_0utc(target_date)
-
-            time_image = ee.Image.constant(utc0_date.millis()).double()
-
-            # Build nodata images / masks that can be placed at the front/back of the
-            #    qm image collections in the event that the collections are empty, and for
-            #    the beginning / end of the time-series
-            bands = source_coll.first().bandNames()
-            # TODO: make sure these time offsets are doing what is expected regarding exclusion
-            prev_qm_mask = ee.Image.constant(ee.List.repeat(1, bands.length())) \
-                .double().rename(bands).updateMask(0) \
-                .set({
-                'system:time_start': utc0_date.advance(
-                    -interp_days - 1, 'day').millis()})
-            next_qm_mask = ee.Image.constant(ee.List.repeat(1, bands.length())) \
-                .double().rename(bands).updateMask(0) \
-                .set({
-                'system:time_start': utc0_date.advance(
-                    interp_days + 2, 'day').millis()})
-
-            # Build separate collections for before and after the target date
-            prev_qm_coll = source_coll.filterDate(
-                utc0_date.advance(-interp_days, 'day'), utc0_date) \
-                .merge(ee.ImageCollection(prev_qm_mask))
-            next_qm_coll = source_coll.filterDate(
-                utc0_date, utc0_date.advance(interp_days + 1, 'day')) \
-                .merge(ee.ImageCollection(next_qm_mask))
-
-            # Flatten the previous / next collections to single images
-            # The closest image in time should be on 'top'
-            prev_qm_image = prev_qm_coll.sort('system:time_start', True).mosaic()
-            next_qm_image = next_qm_coll.sort('system:time_start', False).mosaic()
-
-            # Remove 'time' band before interpolation (this is on images originally from
-            #    the source_coll
-            prev_bands = prev_qm_image.bandNames() \
-                .filter(ee.Filter.notEquals('item', 'time'))
-            next_bands = next_qm_image.bandNames() \
-                .filter(ee.Filter.notEquals('item', 'time'))
-            prev_value_image = ee.Image(prev_qm_image.select(prev_bands)).double()
-            next_value_image = ee.Image(next_qm_image.select(next_bands)).double()
-            prev_time_image = ee.Image(prev_qm_image.select('time')).double()
-            next_time_image = ee.Image(next_qm_image.select('time')).double()
-
-            # NOTE: This may not be necessary for 'global' data products, but retained for
-            #    reference
-            # TODO: verify the note above is correct and adjust as needed
-            # Fill masked values with values from the opposite image. Necessary to ensure
-            #    that there are always tw0 values to interpolate between.
-            prev_time_mosaic = ee.Image(ee.ImageCollection.fromImages([
-                next_time_image, prev_time_image]).mosaic())
-            next_time_mosaic = ee.Image(ee.ImageCollection.fromImages([
-                prev_time_image, next_time_image]).mosaic())
-            prev_value_mosaic = ee.Image(ee.ImageCollection.fromImages([
-                next_value_image, prev_value_image]).mosaic())
-            next_value_mosaic = ee.Image(ee.ImageCollection.fromImages([
-                prev_value_image, next_value_image]).mosaic())
+    if not isinstance(source_coll, (list, tuple)):
+        source_coll = [source_coll]
+    source_colls = [ee.ImageCollection(coll.map(add_date_band)) for coll in source_coll]
+    interp_days = _as_list(interp_days, len(source_colls))
+    interp_method = _as_list(interp_method, len(source_colls))
+
+    for method in interp_method:
+        if method.lower() not in INTERP_METHODS:
+            raise ValueError('Unknown interp_method {!r}, expected one of {}'.format(
+                method, sorted(INTERP_METHODS)))
+    interp_funcs = [INTERP_METHODS[method.lower()].ee for method in interp_method]
+
+    # Band names are only needed once per source, not once per target image
+    source_bands = [coll.first().bandNames() for coll in source_colls]
+    source_value_bands = [bands.filter(ee.Filter.notEquals('item', 'time')) for bands in source_bands]
+
+    def _bracket(coll, bands, days, utc0_date):
+        """
+        Build the previous / next value and time images bracketing a target date for one source
+
+        :param coll: ee.ImageCollection, source images with a 'time' band
+        :param bands: ee.List, band names of the source images
+        :param days: int, number of days before / after the target date to search
+        :param utc0_date: ee.Date, 0 UTC target date
+
+        :return: tuple of ee.Image (prev_value, next_value, prev_time, next_time)
+        """
+
+        # Build nodata images / masks that can be placed at the front/back of the
+        #    qm image collections in the event that the collections are empty, and for
+        #    the beginning / end of the time-series
+        # TODO: make sure these time offsets are doing what is expected regarding exclusion
+        prev_qm_mask = ee.Image.constant(ee.List.repeat(1, bands.length())) \
+            .double().rename(bands).updateMask(0) \
+            .set({
+            'system:time_start': utc0_date.advance(
+                -days - 1, 'day').millis()})
+        next_qm_mask = ee.Image.constant(ee.List.repeat(1, bands.length())) \
+            .double().rename(bands).updateMask(0) \
+            .set({
+            'system:time_start': utc0_date.advance(
+                days + 2, 'day').millis()})
+
+        # Build separate collections for before and after the target date
+        prev_qm_coll = coll.filterDate(
+            utc0_date.advance(-days, 'day'), utc0_date) \
+            .merge(ee.ImageCollection(prev_qm_mask))
+        next_qm_coll = coll.filterDate(
+            utc0_date, utc0_date.advance(days + 1, 'day')) \
+            .merge(ee.ImageCollection(next_qm_mask))
+
+        # Flatten the previous / next collections to single images
+        # The closest image in time should be on 'top'
+        prev_qm_image = prev_qm_coll.sort('system:time_start', True).mosaic()
+        next_qm_image = next_qm_coll.sort('system:time_start', False).mosaic()
+
+        # Remove 'time' band before interpolation (this is on images originally from
+        #    the source_coll
+        prev_bands = prev_qm_image.bandNames() \
+            .filter(ee.Filter.notEquals('item', 'time'))
+        next_bands = next_qm_image.bandNames() \
+            .filter(ee.Filter.notEquals('item', 'time'))
+        prev_value_image = ee.Image(prev_qm_image.select(prev_bands)).double()
+        next_value_image = ee.Image(next_qm_image.select(next_bands)).double()
+        prev_time_image = ee.Image(prev_qm_image.select('time')).double()
+        next_time_image = ee.Image(next_qm_image.select('time')).double()
+
+        # NOTE: This may not be necessary for 'global' data products, but retained for
+        #    reference
+        # TODO: verify the note above is correct and adjust as needed
+        # Fill masked values with values from the opposite image. Necessary to ensure
+        #    that there are always tw0 values to interpolate between.
+        prev_time_mosaic = ee.Image(ee.ImageCollection.fromImages([
+            next_time_image, prev_time_image]).mosaic())
+        next_time_mosaic = ee.Image(ee.ImageCollection.fromImages([
+            prev_time_image, next_time_image]).mosaic())
+        prev_value_mosaic = ee.Image(ee.ImageCollection.fromImages([
+            next_value_image, prev_value_image]).mosaic())
+        next_value_mosaic = ee.Image(ee.ImageCollection.fromImages([
+            prev_value_image, next_value_image]).mosaic())
+
+        return prev_value_mosaic, next_value_mosaic, prev_time_mosaic, next_time_mosaic
+
+    def _interp(image):
+        """
+        Interpolate every source collection to a target image time_start
+
+        :param image: ee.Image, image from the target_coll. All of its bands are returned with the
+            output image.
+
+        :return: ee.Image of interpolated values for each source collection, followed by the
+            target image bands.
+
+        NOTES: the source_coll images must have a time band. This function is intended to be mapped over
+        an image collection and can take only one input parameter (i.e., an image from the target_coll)
+        """
+
+        target_image = ee.Image(image).double()
+        target_date = ee.Date(image.get('system:time_start'))
+
+        # All filtering will be done based on 0 UTC dates
+        utc0_date = date_0utc(target_date)
+
+        time_image = ee.Image.constant(utc0_date.millis()).double()
+
+        interp_images = []
+        for coll, bands, value_bands, days, interp_func in zip(source_colls, source_bands, source_value_bands,
+                                                               interp_days, interp_funcs):
+            prev_value, next_value, prev_time, next_time = _bracket(coll, bands, days, utc0_date)
 
             # Calculate time ratio of current image from target_coll between the other source_coll
             #    images.
-            time_ratio_image = time_image.subtract(prev_time_mosaic) \
-                .divide(next_time_mosaic.subtract(prev_time_mosaic))
+            time_ratio_image = time_image.subtract(prev_time) \
+                .divide(next_time.subtract(prev_time))
+
+            # Source images the method may use, sorted by their 0 UTC time
+            window = coll.filterDate(utc0_date.advance(-days, 'day'), utc0_date.advance(days + 1, 'day')) \
+                .map(lambda source: source.set({
+                'time_0utc': date_0utc(ee.Date(source.get('system:time_start'))).millis()})) \
+                .sort('time_0utc')
 
             # Interpolate values to the current image (i.e., target_coll image) time
-            interp_value_image = next_value_mosaic.subtract(prev_value_mosaic) \
-                .multiply(time_ratio_image).add(prev_value_mosaic)
+            interp_images.append(interp_func(InterpWindow(
+                window.select(value_bands), window.aggregate_array('time_0utc'), utc0_date.millis(),
+                prev_value, next_value, prev_time, next_time, time_ratio_image)))
 
-            return interp_value_image \
-                .addBands(target_image) \
-                .set({
-                'system:index': image.get('system:index'),
-                'system:time_start': image.get('system:time_start')
-            })
+        return ee.Image(interp_images[0]) \
+            .addBands(interp_images[1:] + [target_image]) \
+            .set({
+            'system:index': image.get('system:index'),
+            'system:time_start': image.get('system:time_start')
+        })
 
-        interp_coll = ee.ImageCollection(target_coll.map(_linear))
+    interp_coll = ee.ImageCollection(target_coll.map(_interp))
 
-        return interp_coll
+    return interp_coll
@@ -0,0 +1,168 @@
+"""
+Input checks run before a VegET run is started, so problems with the configuration show up in seconds
+instead of hours into a run as masked or empty outputs.
+
+All checks are built into a single ee.Dictionary and fetched with one getInfo() call. Date coverage, extent
+overlap and band presence only use collection / image metadata. Static image nodata fractions use a coarse,
+best effort reduction over the region.
+
+VegET model code from G. Senay, S. Kagone, and M.Velpuri
+"""
+
+import datetime
+
+import ee
+
+from .utils import millis
+
+# Bands that must be present in the first image of each input collection
+NDVI_BANDS = ('sur_refl_b01', 'sur_refl_b02')
+CLIMATE_BANDS = ('pr', 'eto', 'tmmn', 'tmmx')
+STATIC_INPUTS = ('intercept', 'whc', 'soil_sat', 'fcap')
+
+# Pixel size (m) of the reduction used to estimate static image nodata fractions
+NODATA_SCALE = 5000
+
+DAY_MILLIS = 24 * 60 * 60 * 1000
+
+
+def _date_millis(date_str, days=0):
+    """
+    Milliseconds since epoch of a YYYY-MM-DD date, offset by a number of days
+    """
+    date = datetime.datetime.strptime(date_str, '%Y-%m-%d') + datetime.timedelta(days=days)
+    return millis(date)
+
+
+def _coll_info(coll, start_millis, end_millis, polygon, check_extent):
+    """
+    Metadata needed to check a collection
+    :param coll: ee.ImageCollection
+    :param start_millis: int
+        Start of the date window to summarize
+    :param end_millis: int
+        End (exclusive) of the date window to summarize
+    :param polygon: ee.Geometry
+    :param check_extent: bool
+    :return: ee.Dictionary
+    """
+    window = coll.filterDate(start_millis, end_millis)
+    info = {
+        'count': window.size(),
+        'first': window.aggregate_min('system:time_start'),
+        'last': window.aggregate_max('system:time_start'),
+        'bands': ee.Algorithms.If(coll.size().gt(0), coll.first().bandNames(), ee.List([])),
+    }
+    if check_extent:
+        info['overlaps'] = ee.Algorithms.If(
+            window.size().gt(0), window.first().geometry().intersects(polygon, 1000), False)
+    return ee.Dictionary(info)
+
+
+def _static_info(image, polygon, checks):
+    """
+    Metadata needed to check a static image
+    :param image: ee.Image
+    :param polygon: ee.Geometry
+    :param checks: dict
+        'checks' section of the run configuration
+    :return: ee.Dictionary
+    """
+    info = {}
+    if checks['extent']:
+        info['overlaps'] = image.geometry().intersects(polygon, 1000)
+    if checks['nodata']:
+        info['valid_fraction'] = image.select(0).mask().gt(0).rename('valid').reduceRegion(
+            reducer=ee.Reducer.mean(), geometry=polygon, scale=NODATA_SCALE, bestEffort=True).get('valid')
+    return ee.Dictionary(info)
+
+
+def _check_coverage(name, info, need_first, need_last, problems):
+    """
+    Check that a collection has images on / before the need_first day and on / after the need_last day.
+    Image times are floored to 0 UTC days first, since collections are not all stamped at 0 UTC (e.g., GRIDMET
+    images start at 06:00 UTC).
+    """
+    if not info['count']:
+        problems.append('{}: no images in the run date range'.format(name))
+        return
+    first = info['first'] - info['first'] % DAY_MILLIS
+    last = info['last'] - info['last'] % DAY_MILLIS
+    if first > need_first:
+        problems.append('{}: first image {} is after the required {}'.format(
+            name, _format_millis(info['first']), _format_millis(need_first)))
+    if last < need_last:
+        problems.append('{}: last image {} is before the required {}'.format(
+            name, _format_millis(info['last']), _format_millis(need_last)))
+
+
+def _format_millis(value):
+    return datetime.datetime.utcfromtimestamp(value / 1000.0).strftime('%Y-%m-%d')
+
+
+def check(cfg, polygon):
+    """
+    Check the run inputs before any model computation is scheduled
+    :param cfg: dict
+        Validated run configuration
+    :param polygon: ee.Geometry
+        Region of interest
+    :return: list of str
+        Problems found. Empty if all checks passed.
+    """
+    checks = cfg['checks']
+    inputs = cfg['inputs']
+    dates = cfg['dates']
+    interp_days = inputs['interp_days']
+
+    # NDVI is interpolated, so images up to interp_days outside the run dates are used. This is the same
+    #    window veg_et.build_inputs() uses.
+    ndvi_start = _date_millis(dates['start'], -interp_days)
+    ndvi_end = _date_millis(dates['end'], interp_days)
+    climate_start = _date_millis(dates['start'])
+    climate_end = _date_millis(dates['end'])
+
+    info = ee.Dictionary({
+        'ndvi': _coll_info(ee.ImageCollection(inputs['ndvi']), ndvi_start, ndvi_end, polygon, checks['extent']),
+        'climate': _coll_info(ee.ImageCollection(inputs['climate']), climate_start, climate_end, polygon,
+                              checks['extent']),
+        'statics': ee.Dictionary({
+            name: _static_info(ee.Image(inputs[name]), polygon, checks) for name in STATIC_INPUTS}),
+    })
+
+    try:
+        info = info.getInfo()
+    except ee.EEException as e:
+        return ['Unable to read input metadata: {}'.format(e)]
+
+    problems = []
+    colls = (('ndvi', inputs['ndvi'], NDVI_BANDS), ('climate', inputs['climate'], CLIMATE_BANDS))
+
+    if checks['dates']:
+        # NDVI needs an image on / before the first day and on / after the last day, within interp_days
+        _check_coverage('inputs.ndvi ({})'.format(inputs['ndvi']), info['ndvi'],
+                        climate_start, climate_end - DAY_MILLIS, problems)
+        # Climate forcing is daily, so must cover the first and last day of the run
+        _check_coverage('inputs.climate ({})'.format(inputs['climate']), info['climate'],
+                        climate_start, climate_end - DAY_MILLIS, problems)
+
+    for key, name, required in colls:
+        if checks['bands']:
+            missing = [b for b in required if b not in info[key]['bands']]
+            if missing:
+                problems.append('inputs.{} ({}): missing band(s) {}'.format(key, name, ', '.join(missing)))
+        if checks['extent'] and info[key]['count'] and not info[key]['overlaps']:
+            problems.append('inputs.{} ({}): does not overlap the region'.format(key, name))
+
+    for name in STATIC_INPUTS:
+        static = info['statics'][name]
+        if checks['extent'] and not static['overlaps']:
+            problems.append('inputs.{} ({}): does not overlap the region'.format(name, inputs[name]))
+        if checks['nodata']:
+            valid = static.get('valid_fraction')
+            nodata = 1.0 if valid is None else 1.0 - valid
+            if nodata > checks['max_nodata_fraction']:
+                problems.append('inputs.{} ({}): {:.0%} of the region is nodata (max {:.0%})'.format(
+                    name, inputs[name], nodata, checks['max_nodata_fraction']))
+
+    return problems
@@ -0,0 +1,255 @@
+"""
+Explicit spatial resampling between the coarse forcing grid (e.g., 4 km GRIDMET) and the fine model
+grid (e.g., 250 m MODIS NDVI and static grids).
+
+Earth Engine runs: to_grid() reprojects a whole imageCollection to a reference projection with an explicit
+resampling method, so the mixed-resolution inputs are not left to implicit per-operation reprojection.
+
+Array runs: grid_mapping() computes the source-to-target pixel index mapping (and bilinear weights) once per
+grid pair. The mapping is cached and apply_mapping() uses it to resample every day's forcing with a single
+vectorized gather. window_mapping() cuts the mapping down to one tile of the target grid and the source pixels
+it reads, so tiled backends only read the part of the source they need. config_mapping() builds the mapping
+for the arrays section of a run configuration.
+
+VegET model code from G. Senay, S. Kagone, and M.Velpuri
+"""
+
+import functools
+from collections import namedtuple
+
+import numpy as np
+
+# North-up grid definition. x0 / y0 are the coordinates of the upper left corner of the upper left pixel,
+#    dx / dy are the pixel sizes (dy is negative for north-up grids) and crs is any hashable CRS identifier.
+Grid = namedtuple('Grid', ['x0', 'dx', 'y0', 'dy', 'rows', 'cols', 'crs'])
+
+# Mapping from source to target grid. index has shape (n_target_pixels, n_neighbors) and holds flat source
+#    pixel indices, weight has the same shape. valid flags target pixels that fall inside the source grid.
+GridMapping = namedtuple('GridMapping', ['src', 'dst', 'method', 'index', 'weight', 'valid'])
+
+RESAMPLE_METHODS = ('nearest', 'bilinear')
+
+
+def to_grid(image_coll, ref_image, method='bilinear'):
+    """
+    Resample an Earth Engine imageCollection to the projection of a reference image
+    :param image_coll: ee.ImageCollection
+        Collection to resample (e.g., GRIDMET forcing)
+    :param ref_image: ee.Image
+        Image on the target grid (e.g., first MODIS NDVI image)
+    :param method: {'nearest', 'bilinear'}
+        Resampling method. 'nearest' uses the Earth Engine default resampling.
+    :return: ee.ImageCollection
+    """
+    import ee
+
+    if method not in RESAMPLE_METHODS:
+        raise ValueError('Unknown resampling method {!r}, expected one of {}'.format(method, RESAMPLE_METHODS))
+
+    # Target projection is resolved once for the whole collection
+    proj = ee.Image(ref_image).select(0).projection()
+
+    def _reproject(image):
+        if method != 'nearest':
+            image = image.resample(method)
+        return image.reproject(proj) \
+            .set({
+            'system:index': image.get('system:index'),
+            'system:time_start': image.get('system:time_start')
+        })
+
+    return ee.ImageCollection(image_coll.map(_reproject))
+
+
+def _target_coords(dst):
+    """
+    Pixel center coordinates of a grid
+    :param dst: Grid
+    :return: tuple of np.ndarray (x, y), flattened in row-major order
+    """
+    x = dst.x0 + (np.arange(dst.cols) + 0.5) * dst.dx
+    y = dst.y0 + (np.arange(dst.rows) + 0.5) * dst.dy
+    xx, yy = np.meshgrid(x, y)
+    return xx.ravel(), yy.ravel()
+
+
+@functools.lru_cache(maxsize=16)
+def grid_mapping(src, dst, method='nearest', transform=None):
+    """
+    Compute the source-to-target pixel mapping for a grid pair. Results are cached, so repeated calls for the
+    same grid pair (e.g., every day of a run) return the same mapping.
+    :param src: Grid
+        Source (coarse) grid
+    :param dst: Grid
+        Target (fine) grid
+    :param method: {'nearest', 'bilinear'}
+    :param transform: function, optional
+        Called as transform(x, y) with target grid coordinate arrays and returns the coordinates in the
+        source grid CRS (e.g., pyproj.Transformer.transform). Required if src.crs != dst.crs.
+    :return: GridMapping
+    """
+    if method not in RESAMPLE_METHODS:
+        raise ValueError('Unknown resampling method {!r}, expected one of {}'.format(method, RESAMPLE_METHODS))
+    if src.crs != dst.crs and transform is None:
+        raise ValueError('A coordinate transform is required to map between {} and {}'.format(src.crs, dst.crs))
+
+    x, y = _target_coords(dst)
+    if transform is not None:
+        x, y = transform(x, y)
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+
+    # Fractional source column / row of each target pixel center
+    col = (x - src.x0) / src.dx
+    row = (y - src.y0) / src.dy
+    valid = (col >= 0) & (col < src.cols) & (row >= 0) & (row < src.rows)
+
+    if method == 'nearest':
+        col_idx = np.clip(np.floor(col), 0, src.cols - 1).astype(np.intp)
+        row_idx = np.clip(np.floor(row), 0, src.rows - 1).astype(np.intp)
+        index = (row_idx * src.cols + col_idx)[:, np.newaxis]
+        weight = np.ones(index.shape, dtype=np.float64)
+    else:
+        # Offset to pixel centers, neighbors are clamped to the grid edges
+        col_c = col - 0.5
+        row_c = row - 0.5
+        col0 = np.floor(col_c)
+        row0 = np.floor(row_c)
+        tc = col_c - col0
+        tr = row_c - row0
+        c0 = np.clip(col0, 0, src.cols - 1).astype(np.intp)
+        c1 = np.clip(col0 + 1, 0, src.cols - 1).astype(np.intp)
+        r0 = np.clip(row0, 0, src.rows - 1).astype(np.intp)
+        r1 = np.clip(row0 + 1, 0, src.rows - 1).astype(np.intp)
+        index = np.stack([r0 * src.cols + c0, r0 * src.cols + c1,
+                          r1 * src.cols + c0, r1 * src.cols + c1], axis=1)
+        weight = np.stack([(1 - tr) * (1 - tc), (1 - tr) * tc,
+                           tr * (1 - tc), tr * tc], axis=1)
+        # Neighbors with zero weight (e.g., target pixel centers on source pixel centers) point to the neighbor
+        #    with the largest weight, so a nodata pixel that does not contribute does not make the result nodata
+        nearest = index[np.arange(len(index)), np.argmax(weight, axis=1)]
+        index = np.where(weight > 0, index, nearest[:, np.newaxis])
+
+    # Cached arrays are shared between callers
+    for arr in (index, weight, valid):
+        arr.setflags(write=False)
+
+    return GridMapping(src, dst, method, index, weight, valid)
+
+
+def apply_mapping(mapping, values, fill_value=np.nan):
+    """
+    Resample values on the source grid to the target grid with a precomputed mapping
+    :param mapping: GridMapping
+        Mapping from grid_mapping()
+    :param values: np.ndarray
+        Array with the source grid as its last two dimensions, e.g., (time, band, rows, cols)
+    :param fill_value: float
+        Value for target pixels outside the source grid
+    :return: np.ndarray
+        Array with the target grid as its last two dimensions
+    """
+    values = np.asarray(values)
+    src, dst = mapping.src, mapping.dst
+    if values.shape[-2:] != (src.rows, src.cols):
+        raise ValueError('Expected source grid shape {}, got {}'.format((src.rows, src.cols), values.shape[-2:]))
+
+    lead = values.shape[:-2]
+    flat = values.reshape(lead + (src.rows * src.cols,))
+
+    # Neighbors are gathered and added one at a time, so only the output and one neighbor are held in memory
+    if mapping.method == 'nearest':
+        out = flat[..., mapping.index[:, 0]].astype(np.result_type(flat.dtype, fill_value), copy=False)
+    else:
+        out = np.zeros(lead + (dst.rows * dst.cols,), dtype=np.result_type(flat.dtype, mapping.weight.dtype))
+        for k in range(mapping.index.shape[1]):
+            neighbor = flat[..., mapping.index[:, k]].astype(out.dtype, copy=False)
+            neighbor *= mapping.weight[:, k]
+            out += neighbor
+            # Freed before the next neighbor is gathered
+            del neighbor
+
+    out[..., ~mapping.valid] = fill_value
+    return out.reshape(lead + (dst.rows, dst.cols))
+
+
+def resample(values, src, dst, method='nearest', transform=None, fill_value=np.nan):
+    """
+    Resample values from src to dst grid, reusing the cached mapping for the grid pair
+    :param values: np.ndarray
+        Array with the source grid as its last two dimensions
+    :param src: Grid
+    :param dst: Grid
+    :param method: {'nearest', 'bilinear'}
+    :param transform: function, optional
+        See grid_mapping()
+    :param fill_value: float
+    :return: np.ndarray
+    """
+    return apply_mapping(grid_mapping(src, dst, method, transform), values, fill_value)
+
+
+def window_mapping(mapping, rows, cols):
+    """
+    Restrict a mapping to a window of the target grid
+    :param mapping: GridMapping
+    :param rows: slice
+        Target grid rows of the window
+    :param cols: slice
+        Target grid columns of the window
+    :return: tuple (GridMapping, slice, slice)
+        Mapping from the source window to the target window, and the source grid rows / columns it reads
+    """
+    src, dst = mapping.src, mapping.dst
+    rows = range(dst.rows)[rows]
+    cols = range(dst.cols)[cols]
+    target = np.add.outer(np.asarray(rows) * dst.cols, np.asarray(cols)).ravel()
+    index = mapping.index[target]
+    src_row, src_col = np.divmod(index, src.cols)
+    r0, r1 = int(src_row.min()), int(src_row.max()) + 1
+    c0, c1 = int(src_col.min()), int(src_col.max()) + 1
+
+    window_src = Grid(src.x0 + c0 * src.dx, src.dx, src.y0 + r0 * src.dy, src.dy, r1 - r0, c1 - c0, src.crs)
+    window_dst = Grid(dst.x0 + cols.start * dst.dx, dst.dx, dst.y0 + rows.start * dst.dy, dst.dy,
+                      len(rows), len(cols), dst.crs)
+    window = GridMapping(window_src, window_dst, mapping.method, (src_row - r0) * (c1 - c0) + (src_col - c0),
+                         mapping.weight[target], mapping.valid[target])
+    return window, slice(r0, r1), slice(c0, c1)
+
+
+@functools.lru_cache(maxsize=16)
+def _transform(src_crs, dst_crs):
+    """
+    Coordinate transform from src_crs to dst_crs. Cached so grid_mapping() gets the same (hashable) function
+    for a CRS pair.
+    """
+    try:
+        import pyproj
+    except ImportError:
+        raise ImportError('Resampling between different CRSs requires pyproj: pip install pyproj')
+    return pyproj.Transformer.from_crs(src_crs, dst_crs, always_xy=True).transform
+
+
+def config_mapping(arrays, method, forcing_shape, statics_shape):
+    """
+    Mapping from the forcing grid to the model (statics) grid of an array run configuration
+    :param arrays: dict
+        arrays section of a validated run configuration (see config.py)
+    :param method: {'nearest', 'bilinear'}
+        Resampling method (inputs.resample)
+    :param forcing_shape: tuple of int
+        Shape of the forcing array, the forcing grid is its last two dimensions
+    :param statics_shape: tuple of int
+        Shape of the statics array, the model grid is its last two dimensions
+    :return: GridMapping or None
+        None if arrays.forcing_grid is not set, i.e., the forcing is on the model grid
+    """
+    if arrays['forcing_grid'] is None:
+        return None
+    crs = arrays['crs']
+    forcing_crs = arrays['forcing_crs'] or crs
+    src = Grid(*(float(v) for v in arrays['forcing_grid']), rows=forcing_shape[-2], cols=forcing_shape[-1],
+               crs=forcing_crs)
+    dst = Grid(*(float(v) for v in arrays['grid']), rows=statics_shape[-2], cols=statics_shape[-1], crs=crs)
+    transform = _transform(crs, forcing_crs) if forcing_crs != crs else None
+    return grid_mapping(src, dst, method, transform)
@@ -0,0 +1,219 @@
+"""
+Shared memory process pool for running tiles of the array model in parallel.
+
+The daily forcing block and static grids are copied into multiprocessing.shared_memory buffers once, tile by
+tile, so zarr inputs are never loaded whole into process memory. Workers attach to the buffers when they start,
+so tasks only carry the tile bounds, and each worker writes its tile's outputs directly into a shared output
+buffer. Outputs are written from the shared buffer to the target (e.g., a zarr array) tile by tile as well.
+No large arrays are pickled between processes.
+
+VegET model code from G. Senay, S. Kagone, and M.Velpuri
+"""
+
+import concurrent.futures
+import os
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from . import array_model, resample
+
+# Picklable handle to an array in shared memory
+SharedArray = namedtuple('SharedArray', ['name', 'shape', 'dtype'])
+
+# Arrays attached by a worker process, set by _init_worker()
+_worker_arrays = {}
+
+
+def _create(shape, dtype):
+    """
+    Allocate an array in shared memory
+    :param shape: tuple of int
+    :param dtype: numpy dtype
+    :return: tuple (shared_memory.SharedMemory, np.ndarray, SharedArray)
+    """
+    dtype = np.dtype(dtype)
+    size = max(int(np.prod(shape)) * dtype.itemsize, 1)
+    shm = shared_memory.SharedMemory(create=True, size=size)
+    array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    return shm, array, SharedArray(shm.name, tuple(shape), dtype.str)
+
+
+def _attach(handle):
+    """
+    Attach to an array in shared memory
+    :param handle: SharedArray
+    :return: tuple (shared_memory.SharedMemory, np.ndarray)
+    """
+    shm = shared_memory.SharedMemory(name=handle.name)
+    return shm, np.ndarray(handle.shape, dtype=np.dtype(handle.dtype), buffer=shm.buf)
+
+
+def _init_worker(handles):
+    """
+    Process pool initializer. Attaches the shared arrays once per worker.
+    :param handles: dict
+        SharedArray handles keyed by 'forcing', 'statics' and 'outputs'
+    """
+    for key, handle in handles.items():
+        # Keep the SharedMemory objects alive for as long as the arrays are used
+        _worker_arrays[key] = _attach(handle)
+
+
+def _run_tile(rows, cols, bands, dtype):
+    """
+    Run the model for one tile, writing its outputs into the shared output array
+    :param rows: slice
+    :param cols: slice
+    :param bands: tuple of str
+    :param dtype: numpy dtype
+    """
+    forcing = _worker_arrays['forcing'][1]
+    statics = _worker_arrays['statics'][1]
+    outputs = _worker_arrays['outputs'][1]
+    array_model.vegET_model(forcing[:, :, rows, cols], statics[:, rows, cols], bands=bands, dtype=dtype,
+                            out=outputs[:, :, rows, cols])
+
+
+def tiles(grid_shape, tile_size):
+    """
+    Row / column slices of the tiles covering a grid
+    :param grid_shape: tuple of int
+        (rows, cols)
+    :param tile_size: int
+        Tile edge length in pixels
+    :return: list of tuple (slice, slice)
+    """
+    n_rows, n_cols = grid_shape
+    return [(slice(r, min(r + tile_size, n_rows)), slice(c, min(c + tile_size, n_cols)))
+            for r in range(0, n_rows, tile_size) for c in range(0, n_cols, tile_size)]
+
+
+def _copy_tiles(source, target, tile_size):
+    """
+    Copy an array one spatial tile at a time, so a zarr source or target is read / written in tile sized pieces
+    :param source: array-like
+        (..., rows, cols)
+    :param target: array-like
+        Same shape as source
+    :param tile_size: int
+    """
+    for rows, cols in tiles(source.shape[-2:], tile_size):
+        target[..., rows, cols] = source[..., rows, cols]
+
+
+def _fill_resampled(source, target, mapping, tile_size):
+    """
+    Resample an array to the target grid of a mapping one tile at a time, reading only the source pixels each
+    tile needs
+    :param source: array-like
+        (..., rows, cols) on mapping.src
+    :param target: array-like
+        (..., rows, cols) on mapping.dst
+    :param mapping: resample.GridMapping
+    :param tile_size: int
+    """
+    for rows, cols in tiles(target.shape[-2:], tile_size):
+        tile_mapping, src_rows, src_cols = resample.window_mapping(mapping, rows, cols)
+        target[..., rows, cols] = resample.apply_mapping(tile_mapping, source[..., src_rows, src_cols])
+
+
+def run(forcing, statics, bands=array_model.OUTPUT_BANDS, tile_size=512, workers=None, dtype=np.float64,
+        out=None, mapping=None):
+    """
+    Run the daily water balance over tiles in a process pool sharing the inputs and outputs
+    :param forcing: array-like
+        (time, len(FORCING_BANDS), rows, cols), e.g., numpy or zarr array
+    :param statics: array-like
+        (len(STATIC_BANDS), rows, cols)
+    :param bands: tuple of str
+        Output bands from array_model.OUTPUT_BANDS
+    :param tile_size: int
+        Tile edge length in pixels
+    :param workers: int, optional
+        Number of worker processes (default is the number of cores)
+    :param dtype: numpy dtype
+        Precision of the computation and outputs
+    :param out: array-like, optional
+        Target for the outputs (time, len(bands), rows, cols), e.g., a zarr array. If not given, the outputs
+        are returned as a numpy array.
+    :param mapping: resample.GridMapping, optional
+        Mapping from the forcing grid to the model (statics) grid. If given, forcing is resampled while it is
+        copied into shared memory.
+    :return: np.ndarray or out
+        Outputs (time, len(bands), rows, cols)
+    """
+    bands = tuple(bands)
+    array_model.check_bands(bands)
+    n_days = forcing.shape[0]
+    grid_shape = tuple(statics.shape[1:])
+
+    buffers = []
+    try:
+        handles = {}
+        shm, array, handles['forcing'] = _create(forcing.shape[:2] + grid_shape, dtype)
+        buffers.append(shm)
+        if mapping is None:
+            _copy_tiles(forcing, array, tile_size)
+        else:
+            _fill_resampled(forcing, array, mapping, tile_size)
+        shm, array, handles['statics'] = _create(statics.shape, dtype)
+        buffers.append(shm)
+        _copy_tiles(statics, array, tile_size)
+        shm, outputs, handles['outputs'] = _create((n_days, len(bands)) + grid_shape, dtype)
+        buffers.append(shm)
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers or os.cpu_count(),
+                                                    initializer=_init_worker, initargs=(handles,)) as pool:
+            futures = [pool.submit(_run_tile, rows, cols, bands, dtype)
+                       for rows, cols in tiles(grid_shape, tile_size)]
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+
+        if out is None:
+            return outputs.copy()
+        # Written before the buffers are unlinked
+        _copy_tiles(outputs, out, tile_size)
+        return out
+    finally:
+        for shm in buffers:
+            shm.close()
+            shm.unlink()
+
+
+def run_config(cfg):
+    """
+    Run the shared memory backend for a run configuration (see config.py). Forcing on a coarser grid
+    (arrays.forcing_grid) is resampled to the model grid. Tiling is tuned first if tiling.auto is set. The
+    configuration used and any tuning plan are recorded in the 'run' attribute of the outputs.
+    :param cfg: dict
+        Validated run configuration with backend 'shm'
+    :return: zarr.Array
+        Outputs written to cfg['outputs']['path']
+    """
+    import zarr
+
+    from . import autotune
+
+    # Opened lazily: run() copies them into shared memory tile by tile
+    forcing = zarr.open_array(cfg['arrays']['forcing'], mode='r')
+    statics = zarr.open_array(cfg['arrays']['statics'], mode='r')
+    # Coarse forcing is resampled to the model grid with the cached mapping for the grid pair
+    mapping = resample.config_mapping(cfg['arrays'], cfg['inputs']['resample'], forcing.shape, statics.shape)
+    grid_shape = forcing.shape[2:] if mapping is None else statics.shape[1:]
+    array_model.check_shapes(forcing.shape[:2] + grid_shape, statics.shape)
+
+    plan = None
+    if cfg['tiling']['auto']:
+        cfg, plan = autotune.tune_config(cfg, forcing, statics, mapping)
+
+    bands = list(cfg['outputs']['bands'])
+    tile_size = cfg['tiling']['tile_size']
+    shape = (forcing.shape[0], len(bands)) + grid_shape
+    outputs = zarr.open_array('{}/outputs'.format(cfg['outputs']['path']), mode='w', shape=shape,
+                              chunks=(shape[0], shape[1], tile_size, tile_size), dtype=np.float64)
+    outputs.attrs['bands'] = bands
+    run(forcing, statics, bands, tile_size, cfg['workers'], out=outputs, mapping=mapping)
+    outputs.attrs['run'] = autotune.run_metadata(cfg, plan)
+    return outputs
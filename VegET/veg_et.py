@@ -1,100 +1,158 @@
 """
-Testing VegET runs in interactive Python console.
+VegET runs on Earth Engine from a run configuration (see config.py).
+
+build_inputs() creates the daily model input collection, run() runs the model and export() starts the
+export tasks for the model outputs. Used by the command line interface (cli.py), and can still be run
+in an interactive Python console.
 
 VegET model code from G. Senay, S. Kagone, and M.Velpuri
 Openet code from openet (etdata.org) and (https://github.com/Open-ET)
 """
 
-from VegET import interpolate, daily_aggregate, utils, veg_et_model
-import cartoee as cee
-import matplotlib.pyplot as plt
+from VegET import config, interpolate, resample, utils
 import ee
-import ee.mapclient
 
 ee.Initialize()
 
-# TODO: change all to be user inputs
-
-# Define date range
-# TODO: this needs a check to ensure the dates are within the ranges for the imageCollections
-#    accounting for the extra dates added for interpolation
-start_date = ee.Date('2003-04-01')
-end_date = ee.Date('2003-11-01')
-
-# TODO: needs a check to ensure spatial overlap between this and imageCollections
-# TODO: add ability to include shapefiles or manually defined coordinates
-# Filter to only include images within the colorado and utah boundaries (from ee-api/python examples)
-polygon = ee.Geometry.Polygon([[
-    [-109.05, 37.0], [-102.05, 37.0], [-102.05, 41.0],   # colorado
-    [-109.05, 41.0], [-111.05, 41.0], [-111.05, 42.0],   # utah
-    [-114.05, 42.0], [-114.05, 37.0], [-109.05, 37.0]]])
-
-# Define growing season months as integers. Filtering is inclusive.
-g_season_begin = 4
-g_season_end = 10
-
-# NOTE: for this case, the imagecollections are global or continent wide rasters. Ordinarily, the
-#   imageCollections would need .filterBounds() to the ROI to subset to the images that intersect the
-#   polygon. In this case, the filter does nothing since the images are continent/global scale.
-
-# TODO: Generalize so user can pick raw bands or modeled bands (e.g., ndvi)
-#   and add check to ensure those bands are in the imageCollection, as well as calculations
-#   if necessary from raw bands
-# Get NDVI collection and clip to ROI
-# TODO: cloud masking
-# TODO: Check to see if this could be condensed into one call
-ndvi_coll = ee.ImageCollection("MODIS/006/MOD09Q1").filterDate(start_date, end_date)\
-    .filter(ee.Filter.calendarRange(g_season_begin, g_season_end, 'month'))\
-    .map(lambda f: f.clip(polygon))
-ndvi_coll = ndvi_coll.map(utils.getNDVI)
-# DS: select 'ndvi' may not be necessary. Seems to return a 1 band image
-# ndvi_coll = ndvi_coll.select('NDVI')
-
-# Get daily climate dataset(prexcip, eto, temp)
-# TODO: band is hardcoded to precipitation and daily ref et (et0 -> grass)
-precip_eto_coll = ee.ImageCollection('IDAHO_EPSCOR/GRIDMET').filterDate(start_date, end_date)\
-    .select('pr', 'eto', 'tmmn', 'tmmx').filter(ee.Filter.calendarRange(g_season_begin, g_season_end, 'month'))\
-    .map(lambda f: f.clip(polygon))
-
-# Add band for calculated mean daily temp
-precip_eto_coll = precip_eto_coll.map(utils.dailyMeanTemp)
-# Convert to Celsius
-precip_eto_coll = precip_eto_coll.map(utils.kelvin2celsius).select(['pr', 'eto', 'tminC', 'tmaxC', 'tmeanC'])
-
-# TODO: Condense all static asset integration to a function in utils
-# Specify canopy intercept image or imageCollection. NOTE: Assumes single band image
-canopy_int = ee.Image('users/darin_EE/VegET/Interception').clip(polygon).double().rename('intercept')
-# Get static Soil Water Holding Capacity grid (manually uploaded as GEE asset)
-whc = ee.Image('users/darin_EE/VegET/WaterHoldingCapacity_mm').clip(polygon).double().rename('whc')
-# Get static Soil Saturation image
-soil_sat = ee.Image('users/darin_EE/VegET/SoilSaturation_mm').clip(polygon).double().rename('soil_sat')
-# Get static Field Capacity image
-fcap = ee.Image('users/darin_EE/VegET/FieldCapacity_mm').clip(polygon).double().rename('fcap')
-
-# Create single static image with static inputs as bands
-staticImage = canopy_int.addBands([whc, soil_sat, fcap])
-
-# Add statics to ndvi_coll as bands
-ndvi_coll = ndvi_coll.map(utils.addStaticBands([staticImage]))
-
-# Create daily interpolated ndvi collection
-ndvi_daily = interpolate.daily(precip_eto_coll, ndvi_coll)
-
-# Add date band as 'time'
-ndvi_daily = ee.ImageCollection(ndvi_daily.map(utils.add_date_band))
-#canInt_daily = ee.ImageCollection(canInt_daily.map(utils.add_date_band))
-
-# Merge images to new ImageCollection as bands by date
-# NOTE: eto was removed in interp since it only takes the first band for target coll. Add back here.
-
-#merged_coll = utils.merge_colls(ndvi_daily, precip_eto_coll, bands_2_add = 'eto')
-#merged_coll = utils.merge_colls(merged_coll, canInt_daily, bands_2_add = 'Ei')
-
-# Run VegET model
-vegET_run = veg_et_model.vegET_model(ndvi_daily, polygon)
-
-#if __name__ == '__main__':
-#    pass
+# Settings of the original interactive test run (colorado and utah boundaries from ee-api/python examples)
+EXAMPLE_CONFIG = {
+    'region': {
+        'polygon': [
+            [-109.05, 37.0], [-102.05, 37.0], [-102.05, 41.0],   # colorado
+            [-109.05, 41.0], [-111.05, 41.0], [-111.05, 42.0],   # utah
+            [-114.05, 42.0], [-114.05, 37.0], [-109.05, 37.0]],
+    },
+    'dates': {'start': '2003-04-01', 'end': '2003-11-01'},
+    'outputs': {'path': 'vegET_runs'},
+}
+
+
+def region_geometry(cfg):
+    """
+    Region of interest from the run configuration
+    :param cfg: dict
+        Validated run configuration
+    :return: ee.Geometry
+    """
+    if cfg['region']['polygon'] is not None:
+        return ee.Geometry.Polygon([cfg['region']['polygon']])
+    return ee.FeatureCollection(cfg['region']['asset']).geometry()
+
+
+def build_inputs(cfg, polygon):
+    """
+    Create the daily model input collection
+    :param cfg: dict
+        Validated run configuration
+    :param polygon: ee.Geometry
+        Region of interest
+    :return: ee.ImageCollection
+        Daily images with ndvi, climate and static bands
+    """
+    start_date = ee.Date(cfg['dates']['start'])
+    end_date = ee.Date(cfg['dates']['end'])
+    season = ee.Filter.calendarRange(cfg['dates']['season_begin'], cfg['dates']['season_end'], 'month')
+    inputs = cfg['inputs']
+
+    # NOTE: for this case, the imagecollections are global or continent wide rasters. Ordinarily, the
+    #   imageCollections would need .filterBounds() to the ROI to subset to the images that intersect the
+    #   polygon. In this case, the filter does nothing since the images are continent/global scale.
+
+    # TODO: Generalize so user can pick raw bands or modeled bands (e.g., ndvi)
+    #   and add check to ensure those bands are in the imageCollection, as well as calculations
+    #   if necessary from raw bands
+    # Get NDVI collection and clip to ROI
+    # TODO: cloud masking
+    # NDVI images up to interp_days before / after the run are needed to interpolate the first and last days.
+    #    The growing season filter is not applied to these padding images.
+    ndvi_start = start_date.advance(-inputs['interp_days'], 'day')
+    ndvi_end = end_date.advance(inputs['interp_days'], 'day')
+    ndvi_coll = ee.ImageCollection(inputs['ndvi']).filterDate(ndvi_start, ndvi_end)\
+        .filter(ee.Filter.Or(season, ee.Filter.date(start_date, end_date).Not()))\
+        .map(lambda f: f.clip(polygon))
+    ndvi_coll = ndvi_coll.map(utils.getNDVI)
+
+    # Get daily climate dataset(prexcip, eto, temp)
+    # TODO: band is hardcoded to precipitation and daily ref et (et0 -> grass)
+    precip_eto_coll = ee.ImageCollection(inputs['climate']).filterDate(start_date, end_date)\
+        .select('pr', 'eto', 'tmmn', 'tmmx').filter(season)\
+        .map(lambda f: f.clip(polygon))
+
+    # Add band for calculated mean daily temp
+    precip_eto_coll = precip_eto_coll.map(utils.dailyMeanTemp)
+    # Convert to Celsius
+    precip_eto_coll = precip_eto_coll.map(utils.kelvin2celsius).select(['pr', 'eto', 'tminC', 'tmaxC', 'tmeanC'])
+
+    # Resample the 4 km GRIDMET forcing to the 250 m MODIS grid once, instead of leaving the reprojection
+    #    implicit in every downstream operation
+    precip_eto_coll = resample.to_grid(precip_eto_coll, ndvi_coll.first(), method=inputs['resample'])
+
+    # NOTE: Assumes single band images
+    static_bands = ['intercept', 'whc', 'soil_sat', 'fcap']
+    staticImage = ee.Image([ee.Image(inputs[band]).clip(polygon).double().rename(band) for band in static_bands])
+
+    # Add statics to ndvi_coll as bands
+    ndvi_coll = ndvi_coll.map(utils.addStaticBands([staticImage]))
+
+    # Create daily interpolated ndvi collection. Keeps all precip_eto_coll bands.
+    ndvi_daily = interpolate.daily(precip_eto_coll, ndvi_coll, interp_days=inputs['interp_days'],
+                                   interp_method=inputs['interp_method'])
+
+    # Add date band as 'time'
+    return ee.ImageCollection(ndvi_daily.map(utils.add_date_band))
+
+
+def run(cfg):
+    """
+    Run VegET for a configuration
+    :param cfg: dict
+        Validated run configuration
+    :return: tuple (ee.ImageCollection, ee.Geometry)
+        Model outputs (the first image holds the initial values) and the region of interest
+    """
+    # Imported here since veg_et_model initializes Earth Engine on import
+    from VegET import veg_et_model
+
+    polygon = region_geometry(cfg)
+    daily_coll = build_inputs(cfg, polygon)
+    return veg_et_model.vegET_model(daily_coll, polygon), polygon
+
+
+def export(vegET_run, cfg, polygon):
+    """
+    Start one export task per output band. Each exported image has one band per day.
+    :param vegET_run: ee.ImageCollection
+        Output of run()
+    :param cfg: dict
+        Validated run configuration
+    :param polygon: ee.Geometry
+        Export region
+    :return: list of ee.batch.Task
+    """
+    outputs = cfg['outputs']
+    # Skip the image of initial values, it does not have the daily output bands
+    daily_outputs = ee.ImageCollection(vegET_run.toList(vegET_run.size()).slice(1))
+    run_name = 'vegET_{}_{}'.format(cfg['dates']['start'], cfg['dates']['end']).replace('-', '')
+
+    tasks = []
+    for band in outputs['bands']:
+        image = daily_outputs.select(band).toBands()
+        description = '{}_{}'.format(run_name, band)
+        if outputs['destination'] == 'drive':
+            task = ee.batch.Export.image.toDrive(image=image, description=description, folder=outputs['path'],
+                                                 region=polygon, scale=outputs['scale'], maxPixels=1e13)
+        else:
+            task = ee.batch.Export.image.toAsset(image=image, description=description,
+                                                 assetId='{}/{}'.format(outputs['path'], description),
+                                                 region=polygon, scale=outputs['scale'], maxPixels=1e13)
+        task.start()
+        tasks.append(task)
+    return tasks
+
+
+if __name__ == '__main__':
+    # Interactive test run with the original settings
+    vegET_run, polygon = run(config.validate(EXAMPLE_CONFIG))
 
 # Show map example (NOTE: outdated visualization, but used for initial testing)
-#ee.mapclient.addToMap(vegET_run.first())2
\ No newline at end of file
+#ee.mapclient.addToMap(vegET_run.first())
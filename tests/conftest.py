@@ -0,0 +1,21 @@
+"""
+pytest options for the VegET tests.
+
+    python -m pytest                      # every compute path must run
+    python -m pytest --allow-skips        # skip compute paths whose dependencies (e.g., dask) are missing
+    python -m pytest --update-goldens     # regenerate tests/golden (only after an intended change in results)
+"""
+
+import pytest
+
+
+def pytest_addoption(parser):
+    parser.addoption('--update-goldens', action='store_true',
+                     help='Regenerate the golden outputs in tests/golden before checking them')
+    parser.addoption('--allow-skips', action='store_true',
+                     help='Skip compute paths with missing dependencies instead of failing them')
+
+
+@pytest.fixture(scope='session')
+def allow_skips(request):
+    return request.config.getoption('--allow-skips')
@@ -0,0 +1,26 @@
+"""
+Tests of the numpy array model that the synthetic regression inputs do not cover.
+"""
+
+import numpy as np
+
+from VegET import array_model
+
+
+def _one_pixel(pr, eto, tmin, tmax, tmean, ndvi):
+    forcing = np.array([pr, eto, tmin, tmax, tmean, ndvi], dtype=np.float64).reshape(1, -1, 1, 1)
+    statics = np.array([10.0, 50.0, 100.0, 70.0]).reshape(-1, 1, 1)
+    return forcing, statics
+
+
+def test_snow_fast_path_negative_melt_rate():
+    # All rain (tmean > 6) but tmax < 0, so the melt rate is negative and the snowpack goes negative
+    forcing, statics = _one_pixel(pr=5.0, eto=3.0, tmin=-2.0, tmax=-1.0, tmean=15.0, ndvi=0.5)
+    tmin, tmax, tmean = forcing[0, 2:5]
+    assert not array_model.is_snow_free(tmean, tmin, tmax)
+    assert not array_model.is_snow_free(tmean, tmin, tmax, 0.06 * tmax * (tmax - tmin))
+
+    fast = array_model.vegET_model(forcing, statics, snow_fast_path=True)[0]
+    full = array_model.vegET_model(forcing, statics, snow_fast_path=False)[0]
+    assert fast[0, array_model.OUTPUT_BANDS.index('rain_frac')] == 1.0
+    np.testing.assert_array_equal(fast, full)
@@ -0,0 +1,88 @@
+"""
+Tests of the input checks for the array backends and the check / run commands.
+"""
+
+import numpy as np
+import pytest
+import yaml
+import zarr
+
+from VegET import array_precheck, cli, config
+from test_regression import N_DAYS, synthetic_inputs
+
+
+def _write_inputs(tmp_path, forcing=None, statics=None, **arrays):
+    """
+    Write zarr inputs and return a validated configuration for them
+    """
+    default_forcing, default_statics = synthetic_inputs()
+    forcing = default_forcing if forcing is None else forcing
+    statics = default_statics if statics is None else statics
+    for name, values in (('forcing', forcing), ('statics', statics)):
+        store = zarr.open_array(str(tmp_path / (name + '.zarr')), mode='w', shape=values.shape, dtype=values.dtype)
+        store[:] = values
+    return config.validate({
+        'dates': {'start': '2020-01-01', 'end': '2020-01-{:02d}'.format(1 + N_DAYS)},
+        'outputs': {'path': str(tmp_path / 'outputs.zarr')},
+        'arrays': dict({'forcing': str(tmp_path / 'forcing.zarr'), 'statics': str(tmp_path / 'statics.zarr')},
+                       **arrays),
+        'backend': 'dask',
+    })
+
+
+def test_inputs_pass(tmp_path):
+    assert array_precheck.check(_write_inputs(tmp_path)) == []
+
+
+def test_forcing_days(tmp_path):
+    forcing = synthetic_inputs()[0][:-2]
+    problems = array_precheck.check(_write_inputs(tmp_path, forcing=forcing))
+    assert len(problems) == 1 and '{} days of forcing'.format(N_DAYS - 2) in problems[0]
+
+
+def test_shapes(tmp_path):
+    forcing, statics = synthetic_inputs()
+    problems = array_precheck.check(_write_inputs(tmp_path, forcing=forcing[:, :5]))
+    assert len(problems) == 1 and 'forcing: expected shape' in problems[0]
+    problems = array_precheck.check(_write_inputs(tmp_path, statics=statics[:, :, :-1]))
+    assert len(problems) == 1 and 'statics: expected shape' in problems[0]
+
+
+def test_statics_nodata(tmp_path):
+    statics = synthetic_inputs()[1]
+    statics[1, :2] = np.nan
+    problems = array_precheck.check(_write_inputs(tmp_path, statics=statics))
+    assert len(problems) == 1 and '67% of band whc is nodata' in problems[0]
+
+
+def test_forcing_grid_extent(tmp_path):
+    grid = [0.0, 1.0, 0.0, -1.0]
+    assert array_precheck.check(_write_inputs(tmp_path, grid=grid, forcing_grid=[0.0, 1.0, 0.0, -1.0])) == []
+    problems = array_precheck.check(_write_inputs(tmp_path, grid=grid, forcing_grid=[100.0, 1.0, 0.0, -1.0]))
+    assert problems == ['arrays.forcing_grid: does not overlap the model grid']
+    problems = array_precheck.check(_write_inputs(tmp_path, grid=grid, forcing_grid=[3.0, 1.0, 0.0, -1.0]))
+    assert problems == ['arrays.forcing_grid: 75% of the model grid is outside the forcing (max 50%)']
+
+
+def test_missing_arrays(tmp_path):
+    cfg = _write_inputs(tmp_path)
+    cfg['arrays']['forcing'] = str(tmp_path / 'missing.zarr')
+    problems = array_precheck.check(cfg)
+    assert len(problems) == 1 and problems[0].startswith('Unable to read the input arrays')
+
+
+def test_cli_check(tmp_path, capsys):
+    path = tmp_path / 'config.yaml'
+    path.write_text(yaml.safe_dump(_write_inputs(tmp_path)))
+    assert cli.main(['check', str(path)]) == 0
+    assert 'All input checks passed' in capsys.readouterr().out
+
+
+@pytest.mark.parametrize('command', ['check', 'run'])
+def test_cli_stops_on_problems(tmp_path, capsys, command):
+    cfg = _write_inputs(tmp_path, forcing=synthetic_inputs()[0][:-2])
+    path = tmp_path / 'config.yaml'
+    path.write_text(yaml.safe_dump(cfg))
+    assert cli.main([command, str(path)]) == 1
+    assert 'days of forcing' in capsys.readouterr().err
+    assert not (tmp_path / 'outputs.zarr').exists()
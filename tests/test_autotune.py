@@ -0,0 +1,89 @@
+"""
+Tests of the chunk size tuning memory estimates and plan choice.
+"""
+
+import numpy as np
+import pytest
+
+from VegET import array_model, autotune, config
+
+GRID_SHAPE = (3000, 2000)
+N_DAYS = 365
+N_BANDS = 5
+
+
+def _calibration(tile_sizes=autotune.TILE_SIZES):
+    # Larger tiles are a bit faster per pixel and need a bit less working memory per pixel
+    return [{'tile_size': size, 'seconds_per_pixel_day': 1e-7 * (1 + 64.0 / size),
+             'work_bytes_per_pixel': 400.0 + 1e5 / size} for size in tile_sizes]
+
+
+@pytest.mark.parametrize('neighbors', [0, 4])
+@pytest.mark.parametrize('memory_budget', ['200MB', '2GB', '1TB'])
+@pytest.mark.parametrize('backend', ['dask', 'shm'])
+def test_plan_fits_budget(backend, memory_budget, neighbors):
+    try:
+        plan = autotune.choose(_calibration(), GRID_SHAPE, N_DAYS, N_BANDS, memory_budget, max_workers=8,
+                               backend=backend, neighbors=neighbors)
+    except ValueError:
+        # The shm backend holds the whole run in memory
+        assert backend == 'shm' and memory_budget != '1TB'
+        return
+    assert plan['estimated_bytes'] <= config.parse_bytes(memory_budget)
+    assert 1 <= plan['workers'] <= 8
+    assert 1 <= plan['time_chunk'] <= N_DAYS
+    if backend == 'shm':
+        assert plan['time_chunk'] == N_DAYS
+
+
+@pytest.mark.parametrize('backend', ['dask', 'shm'])
+def test_workers_limits(backend):
+    plan = autotune.choose(_calibration(), GRID_SHAPE, N_DAYS, N_BANDS, '1TB', max_workers=3, backend=backend)
+    assert plan['workers'] == 3
+
+    # A single 2048 tile covers the grid, more workers than tiles are never used
+    plan = autotune.choose(_calibration([2048]), (1500, 2000), N_DAYS, N_BANDS, '1TB', max_workers=8,
+                           backend=backend)
+    assert plan['workers'] == 1
+
+
+def test_shm_counts_shared_bytes():
+    shared = 8 * GRID_SHAPE[0] * GRID_SHAPE[1] * (N_DAYS * (len(array_model.FORCING_BANDS) + N_BANDS) +
+                                                  len(array_model.STATIC_BANDS))
+    plan = autotune.choose(_calibration(), GRID_SHAPE, N_DAYS, N_BANDS, 2 * shared, backend='shm')
+    copy_bytes = autotune._copy_bytes(plan['tile_size'], N_DAYS, N_BANDS, 8)
+    assert plan['estimated_bytes'] >= shared + copy_bytes
+
+    # Fits a dask run, which only holds time windows of its tiles, but not the shared arrays
+    autotune.choose(_calibration(), GRID_SHAPE, N_DAYS, N_BANDS, shared // 2, backend='dask')
+    with pytest.raises(ValueError):
+        autotune.choose(_calibration(), GRID_SHAPE, N_DAYS, N_BANDS, shared // 2, backend='shm')
+
+
+def test_neighbors_count_resampling_memory():
+    plain = autotune.choose(_calibration(), GRID_SHAPE, N_DAYS, N_BANDS, '1GB', max_workers=4)
+    resampled = autotune.choose(_calibration(), GRID_SHAPE, N_DAYS, N_BANDS, '1GB', max_workers=4, neighbors=4)
+    assert resampled['time_chunk'] < plain['time_chunk'] or resampled['tile_size'] < plain['tile_size']
+
+    single = autotune._copy_bytes(256, N_DAYS, N_BANDS, 8)
+    assert autotune._copy_bytes(256, N_DAYS, N_BANDS, 8, neighbors=4) == 2 * single
+    assert single == autotune.SAFETY_FACTOR * 256 * 256 * N_DAYS * len(array_model.FORCING_BANDS) * 8
+    assert autotune._copy_bytes(256, N_DAYS, 20, 8) == autotune.SAFETY_FACTOR * 256 * 256 * N_DAYS * 20 * 8
+
+
+def test_empty_calibration():
+    with pytest.raises(ValueError):
+        autotune.choose([], GRID_SHAPE, N_DAYS, N_BANDS, '16GB')
+
+
+def test_calibrate_skips_tiles_over_budget():
+    forcing = np.ones((4, len(array_model.FORCING_BANDS), 16, 16))
+    statics = np.full((len(array_model.STATIC_BANDS), 16, 16), 50.0)
+    sizes = (4, 8, 16)
+    assert [autotune._calibration_bytes(s, 4, 2, 8) for s in sizes] == \
+        sorted(autotune._calibration_bytes(s, 4, 2, 8) for s in sizes)
+
+    budget = int(autotune._calibration_bytes(8, 4, 2, 8))
+    calibration = autotune.calibrate(forcing, statics, ('etasw', 'swf'), sizes, memory_budget=budget)
+    assert [entry['tile_size'] for entry in calibration] == [4, 8]
+    assert all(entry['seconds_per_pixel_day'] > 0 and entry['work_bytes_per_pixel'] > 0 for entry in calibration)
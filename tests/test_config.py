@@ -0,0 +1,106 @@
+"""
+Tests of the run configuration checks.
+"""
+
+import pytest
+
+from VegET import config
+
+
+def _config(**sections):
+    cfg = {
+        'region': {'polygon': [[-109.05, 37.0], [-102.05, 37.0], [-102.05, 41.0]]},
+        'dates': {'start': '2003-04-01', 'end': '2003-11-01'},
+        'outputs': {'path': 'vegET_runs'},
+    }
+    for name, section in sections.items():
+        cfg[name] = dict(cfg.get(name, {}), **section) if isinstance(section, dict) else section
+    return cfg
+
+
+def _arrays(**arrays):
+    return dict({'forcing': 'forcing.zarr', 'statics': 'statics.zarr'}, **arrays)
+
+
+def test_defaults():
+    cfg = config.validate(_config())
+    assert cfg['backend'] == 'ee'
+    assert cfg['inputs']['interp_method'] == 'linear'
+    assert cfg['dates']['season_begin'] == 4 and cfg['dates']['season_end'] == 10
+    assert cfg['workers'] == 1
+
+
+@pytest.mark.parametrize('cfg', [
+    _config(extra={'a': 1}),
+    _config(inputs={'interp_day': 16}),
+    _config(tiling={'tile': 256}),
+])
+def test_unknown_keys(cfg):
+    with pytest.raises(config.ConfigError, match='Unknown setting'):
+        config.validate(cfg)
+
+
+@pytest.mark.parametrize('cfg', [
+    _config(inputs={'interp_days': True}),
+    _config(workers=False),
+    _config(dates={'season_begin': True}),
+    _config(checks={'max_nodata_fraction': True}),
+])
+def test_bool_is_not_int(cfg):
+    with pytest.raises(config.ConfigError, match='expected'):
+        config.validate(cfg)
+
+
+def test_wrap_around_season():
+    cfg = config.validate(_config(dates={'season_begin': 11, 'season_end': 3}))
+    assert (cfg['dates']['season_begin'], cfg['dates']['season_end']) == (11, 3)
+    with pytest.raises(config.ConfigError, match='season_end'):
+        config.validate(_config(dates={'season_end': 13}))
+
+
+def test_output_bands_per_backend():
+    # intercept_1 only exists in the Earth Engine outputs, intppt only in the array outputs
+    config.validate(_config(outputs={'bands': ['etasw', 'intercept_1']}))
+    config.validate(_config(outputs={'bands': ['etasw', 'intppt']}, backend='dask', arrays=_arrays()))
+    with pytest.raises(config.ConfigError, match='intppt'):
+        config.validate(_config(outputs={'bands': ['etasw', 'intppt']}))
+    with pytest.raises(config.ConfigError, match='intercept_1'):
+        config.validate(_config(outputs={'bands': ['intercept_1']}, backend='shm', arrays=_arrays()))
+    with pytest.raises(config.ConfigError, match='outputs.bands'):
+        config.validate(_config(outputs={'bands': []}))
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('16GB', 16 * 10 ** 9), ('512MiB', 512 * 2 ** 20), ('1.5 gb', 1.5 * 10 ** 9), ('2048', 2048), (4096, 4096),
+])
+def test_parse_bytes(value, expected):
+    assert config.parse_bytes(value) == expected
+
+
+@pytest.mark.parametrize('budget', ['lots', '16XB', '0GB', -1])
+def test_invalid_memory_budget(budget):
+    with pytest.raises(config.ConfigError, match='tiling.memory_budget'):
+        config.validate(_config(backend='dask', arrays=_arrays(), tiling={'memory_budget': budget}))
+
+
+def test_auto_tiling():
+    with pytest.raises(config.ConfigError, match='memory_budget'):
+        config.validate(_config(backend='dask', arrays=_arrays(), tiling={'auto': True}))
+    with pytest.raises(config.ConfigError, match='array backends'):
+        config.validate(_config(tiling={'auto': True, 'memory_budget': '16GB'}))
+    cfg = config.validate(_config(backend='shm', arrays=_arrays(), tiling={'auto': True, 'memory_budget': '16GB'}))
+    assert cfg['workers'] >= 1
+
+
+def test_array_grids():
+    with pytest.raises(config.ConfigError, match='arrays.forcing'):
+        config.validate(_config(backend='dask'))
+    with pytest.raises(config.ConfigError, match='arrays.grid: required'):
+        config.validate(_config(backend='dask', arrays=_arrays(forcing_grid=[0, 4000, 0, -4000])))
+    with pytest.raises(config.ConfigError, match='non-zero pixel sizes'):
+        config.validate(_config(backend='dask', arrays=_arrays(grid=[0, 250, 0, 0], forcing_grid=[0, 4000, 0, -4000])))
+    with pytest.raises(config.ConfigError, match='arrays.crs: required'):
+        config.validate(_config(backend='dask', arrays=_arrays(forcing_crs='EPSG:4326')))
+    cfg = config.validate(_config(backend='dask', arrays=_arrays(grid=[0, 250, 0, -250],
+                                                                  forcing_grid=[0, 4000, 0, -4000])))
+    assert cfg['arrays']['forcing_grid'] == [0, 4000, 0, -4000]
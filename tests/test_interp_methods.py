@@ -0,0 +1,69 @@
+"""
+Tests of the interpolation method registry and the smoothing spline.
+"""
+
+import numpy as np
+
+from VegET import array_model, config, interp_methods
+
+KNOTS = np.array([0.0, 8.0, 13.0, 24.0, 32.0])
+
+
+def _spline(times, values, target_time, smoothing):
+    penalty, evaluation = interp_methods.spline_coefficients(times, target_time, smoothing)
+    return evaluation.dot(np.linalg.solve(np.eye(len(times)) + penalty, values))
+
+
+def test_spline_reproduces_linear_data():
+    values = 0.2 + 0.01 * KNOTS
+    for day in (1.0, 8.0, 10.5, 20.0, 31.0):
+        assert np.isclose(_spline(KNOTS, values, day, 64.0), 0.2 + 0.01 * day)
+
+
+def test_spline_penalty_is_roughness():
+    # The penalty is the integral of the squared second derivative of the spline through the values
+    values = np.array([0.1, 0.4, 0.2, 0.9, 0.3])
+    days = np.linspace(KNOTS[0], KNOTS[-1], 16001)
+    curve = np.array([interp_methods.spline_coefficients(KNOTS, day, 1.0)[1].dot(values) for day in days])
+    second = np.gradient(np.gradient(curve, days), days)[5:-5]
+    roughness = np.sum((second[1:] ** 2 + second[:-1] ** 2) / 2.0 * np.diff(days[5:-5]))
+    penalty = interp_methods.spline_coefficients(KNOTS, 3.0, 1.0)[0]
+    assert np.isclose(values.dot(penalty).dot(values), roughness, rtol=1e-4)
+
+
+def test_spline_smooths_towards_linear():
+    values = np.array([0.2, 0.6, 0.2, 0.6, 0.2])
+    rough = _spline(KNOTS, values, 8.0, 1e-6)
+    smooth = _spline(KNOTS, values, 8.0, 1e4)
+    assert np.isclose(rough, 0.6)
+    assert abs(smooth - values.mean()) < abs(rough - values.mean())
+
+
+def test_spline_ignores_nodata_and_padding():
+    # Nodata source images get zero weight: the fit equals the spline through the valid images only
+    source_days = np.array([0, 8, 16, 24, 32])
+    source = np.array([0.2, 0.5, np.nan, 0.3, 0.6])[:, np.newaxis]
+    out = array_model.interp_daily([12, 20], source_days, source, interp_days=32, interp_method='spline')
+    valid = ~np.isnan(source[:, 0])
+    expected = [_spline(source_days[valid], source[valid, 0], day, interp_methods.SPLINE_SMOOTHING)
+                for day in (12, 20)]
+    assert np.allclose(out[:, 0], expected)
+
+
+def test_register_method():
+    def _ee_zero(window):
+        return window.prev_value.multiply(0)
+
+    def _array_zero(window):
+        return np.zeros_like(window.prev_value)
+
+    interp_methods.register_method('Zero', _ee_zero, _array_zero)
+    try:
+        cfg = config.validate({'region': {'polygon': [[0, 0], [1, 0], [1, 1]]},
+                               'dates': {'start': '2020-01-01', 'end': '2020-02-01'},
+                               'inputs': {'interp_method': 'zero'}, 'outputs': {'path': 'runs'}})
+        assert cfg['inputs']['interp_method'] == 'zero'
+        out = array_model.interp_daily([1, 2], [0, 4], np.ones((2, 3)), interp_method='ZERO')
+        assert np.array_equal(out, np.zeros((2, 3)))
+    finally:
+        del interp_methods.INTERP_METHODS['zero']
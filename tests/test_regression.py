@@ -0,0 +1,292 @@
+"""
+Regression and equivalence tests for the array compute paths.
+
+Small deterministic synthetic inputs (synthetic_inputs()) exercise the snow, mixed rain / snow, rain, runoff,
+saturation and NDVI threshold branches of the water balance, and the nodata filling of the interpolation.
+Golden outputs computed from these inputs are stored in tests/golden/. Every compute path in COMPUTE_PATHS
+(backends and precision modes) is compared with the goldens, band by band, within the tolerances for its
+precision.
+
+    python -m pytest tests/test_regression.py
+    python -m pytest tests/test_regression.py --update-goldens   # only after an intended change in results
+
+A compute path whose dependencies are not installed (e.g., dask) fails unless --allow-skips is given.
+
+Not covered: daily_aggregate.aggregate_to_daily() only exists as an Earth Engine implementation, so it can not
+be run offline against goldens. It has no array counterpart yet.
+
+VegET model code from G. Senay, S. Kagone, and M.Velpuri
+"""
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+from VegET import array_model
+
+GOLDEN_DIR = os.path.join(os.path.dirname(__file__), 'golden')
+WATER_BALANCE_GOLDEN = os.path.join(GOLDEN_DIR, 'water_balance.json')
+INTERP_GOLDEN = os.path.join(GOLDEN_DIR, 'interp.json')
+
+N_DAYS = 16
+N_ROWS = 3
+N_COLS = 4
+
+# (rtol, atol) per precision, with per band overrides for bands that amplify rounding errors
+TOLERANCES = {
+    'float64': (1e-9, 1e-9),
+    'float32': (1e-5, 1e-3),
+}
+BAND_TOLERANCES = {
+    'float32': {
+        # Ratio of swi to whc
+        'etasw2': (1e-4, 1e-3),
+        'rain_frac': (1e-6, 1e-6),
+    },
+}
+
+# Branches of the water balance that the synthetic inputs must exercise. Each is tested on the golden outputs.
+BRANCHES = {
+    'snow (rain_frac == 0)': lambda o: np.any(o['rain_frac'] == 0.0),
+    'mixed rain / snow': lambda o: np.any((o['rain_frac'] > 0.0) & (o['rain_frac'] < 1.0)),
+    'rain (rain_frac == 1)': lambda o: np.any(o['rain_frac'] == 1.0),
+    'snowpack accumulation': lambda o: np.any(o['snowpack'] > 0.0),
+    'snowmelt limited by snow': lambda o: np.any((o['snowmelt'] > 0.0) & (o['snowmelt'] < o['melt_rate'])),
+    'runoff below sat_fc': lambda o: np.any((o['rf'] > 0.0) & (o['rf'] <= o['sat_fc'])),
+    'runoff above sat_fc': lambda o: np.any(o['rf'] > o['sat_fc']),
+    'saturation (swi > whc)': lambda o: np.any(o['swf'] == o['bigswi']) and np.any(o['rf1'] > 0.0),
+    'soil water stress (swi <= whc / 2)': lambda o: np.any(o['etasw3'] != o['etasw1']),
+    'et limited by swi': lambda o: np.any(o['etasw4'] < o['etasw3']),
+    'ndvi > 0.4': lambda o: np.any(o['etasw1'] == o['etasw1A']) and np.any(o['etasw1A'] != o['etasw1B']),
+    'ndvi <= 0.4': lambda o: np.any((o['etasw1'] == o['etasw1B']) & (o['etasw1A'] != o['etasw1B'])),
+    'snow free day': lambda o: np.any(np.all(o['rain_frac'][1:] == 1.0, axis=(1, 2)) &
+                                      np.all(o['snowpack'][:-1] == 0.0, axis=(1, 2))),
+}
+
+
+def synthetic_inputs():
+    """
+    Deterministic synthetic model inputs
+    :return: tuple of np.ndarray (forcing, statics)
+        forcing (N_DAYS, len(FORCING_BANDS), N_ROWS, N_COLS) and statics (len(STATIC_BANDS), N_ROWS, N_COLS)
+    """
+    day = np.arange(N_DAYS, dtype=np.float64)[:, np.newaxis, np.newaxis]
+    row = np.arange(N_ROWS, dtype=np.float64)[np.newaxis, :, np.newaxis]
+    col = np.arange(N_COLS, dtype=np.float64)[np.newaxis, np.newaxis, :]
+    shape = (N_DAYS, N_ROWS, N_COLS)
+
+    # Columns go from a cold pixel with a snowpack that melts as it warms up, to a warm pixel
+    tmean = np.broadcast_to(-6.0 + 2.0 * day + 7.0 * col - 1.5 * row, shape)
+    tmin = tmean - 5.0 - col
+    tmax = tmean + 5.0 + col
+    # Storms on days 2 and 6 over part of the grid, and light rain every third day. The last pixel of the
+    #    first row only gets the light rain, so it dries out.
+    pr = np.broadcast_to(np.where((day == 2) & (row >= 1) & (col >= 1), 60.0 + 40.0 * row, 0.0) +
+                         np.where((day == 6) & (col == 1), 150.0, 0.0) +
+                         np.where(day % 3 == 1, 1.0 + col, 0.0), shape)
+    eto = np.broadcast_to(2.0 + 0.4 * day + 0.5 * col, shape)
+    ndvi = np.broadcast_to(0.15 + 0.05 * day + 0.1 * row - 0.02 * col, shape)
+    forcing = np.stack([pr, eto, tmin, tmax, tmean, ndvi], axis=1)
+
+    row, col = np.mgrid[0:N_ROWS, 0:N_COLS].astype(np.float64)
+    intercept = 5.0 + 5.0 * col + 2.0 * row
+    # Very low water holding capacity for the dry pixel, so ET is limited by available soil water
+    whc = np.where((row == 0) & (col == N_COLS - 1), 3.0, 40.0 + 30.0 * row + 10.0 * col)
+    fcap = 60.0 + 20.0 * row
+    soil_sat = fcap + 10.0 + 25.0 * col
+    statics = np.stack([intercept, whc, soil_sat, fcap])
+
+    return np.ascontiguousarray(forcing), np.ascontiguousarray(statics)
+
+
+# Source images for the interpolation checks. Day numbers are relative to the first target day.
+INTERP_DAYS = 10
+SOURCE_DAYS = (0, 8, 16, 24)
+TARGET_DAYS = tuple(range(-3, 31))
+
+
+def synthetic_source():
+    """
+    Deterministic synthetic source images (e.g., 8-day NDVI) with nodata gaps
+    :return: np.ndarray
+        (len(SOURCE_DAYS), N_ROWS, N_COLS) with NaN as nodata
+    """
+    row, col = np.mgrid[0:N_ROWS, 0:N_COLS].astype(np.float64)
+    values = np.stack([0.2 + 0.1 * i + 0.05 * row - 0.03 * col * (i % 2) for i in range(len(SOURCE_DAYS))])
+    # Gaps: one pixel missing in one image, and one pixel missing in consecutive images
+    values[1, 0, 0] = np.nan
+    values[1:3, 2, 3] = np.nan
+    return values
+
+
+def _numpy_water_balance(dtype, snow_fast_path=True):
+    def water_balance(forcing, statics):
+        return array_model.vegET_model(forcing, statics, dtype=dtype, snow_fast_path=snow_fast_path)[0]
+    return water_balance
+
+
+def _numpy_interp(target_days, source_days, source_values, interp_days, interp_method):
+    return array_model.interp_daily(target_days, source_days, source_values, interp_days, interp_method)
+
+
+def _dask_water_balance(forcing, statics):
+    from VegET import dask_backend
+
+    # Small tiles and time windows so chunk edges and state carry between windows are exercised
+    with dask_backend.scheduler('threads', 2):
+        return dask_backend.run(forcing, statics, tile_size=2, time_chunk=5)
+
+
+def _dask_interp(target_days, source_days, source_values, interp_days, interp_method):
+    from VegET import dask_backend
+
+    with dask_backend.scheduler('threads', 2):
+        return dask_backend.interp_daily(target_days, source_days, source_values, interp_days, interp_method,
+                                         tile_size=2).compute()
+
+
+def _shm_water_balance(forcing, statics):
+    from VegET import shm_executor
+
+    return shm_executor.run(forcing, statics, tile_size=2, workers=2)
+
+
+# Compute paths checked against the goldens: name -> (precision, water_balance, interp). water_balance is called
+#    as water_balance(forcing, statics) and returns all array_model.OUTPUT_BANDS. interp has the signature of
+#    array_model.interp_daily(), or is None if the path has no interpolation.
+COMPUTE_PATHS = {
+    'numpy': ('float64', _numpy_water_balance(np.float64), _numpy_interp),
+    'numpy-float32': ('float32', _numpy_water_balance(np.float32), None),
+    'numpy-no-snow-fast-path': ('float64', _numpy_water_balance(np.float64, snow_fast_path=False), None),
+    'dask': ('float64', _dask_water_balance, _dask_interp),
+    'shm': ('float64', _shm_water_balance, None),
+}
+
+
+def _reference():
+    """
+    Reference results from the numpy float64 path, always running the full snow module
+    :return: tuple of (np.ndarray, dict)
+        Water balance outputs and interpolated values keyed by method
+    """
+    forcing, statics = synthetic_inputs()
+    outputs = array_model.vegET_model(forcing, statics, snow_fast_path=False)[0]
+    interp = {method: array_model.interp_daily(TARGET_DAYS, SOURCE_DAYS, synthetic_source(), INTERP_DAYS, method)
+              for method in sorted(array_model.INTERP_METHODS)}
+    return outputs, interp
+
+
+def _to_json(array):
+    # NaN is not valid JSON, store nodata as null
+    return np.where(np.isnan(array), None, array).tolist()
+
+
+def _from_json(values):
+    return np.array(values, dtype=np.float64)
+
+
+def update_goldens():
+    """
+    Regenerate the golden outputs from the numpy float64 path, always running the full snow module
+    """
+    outputs, interp = _reference()
+    if not os.path.isdir(GOLDEN_DIR):
+        os.makedirs(GOLDEN_DIR)
+    with open(WATER_BALANCE_GOLDEN, 'w') as f:
+        json.dump({'bands': list(array_model.OUTPUT_BANDS),
+                   'outputs': {band: _to_json(outputs[:, i]) for i, band in enumerate(array_model.OUTPUT_BANDS)}},
+                  f, separators=(',', ':'))
+    with open(INTERP_GOLDEN, 'w') as f:
+        json.dump({'interp_days': INTERP_DAYS, 'source_days': list(SOURCE_DAYS), 'target_days': list(TARGET_DAYS),
+                   'methods': {method: _to_json(values) for method, values in interp.items()}},
+                  f, separators=(',', ':'))
+
+
+def load_goldens():
+    """
+    Read the golden outputs
+    :return: tuple of dict
+        Water balance outputs keyed by band, and interpolated values keyed by method
+    """
+    with open(WATER_BALANCE_GOLDEN) as f:
+        water_balance = json.load(f)
+    with open(INTERP_GOLDEN) as f:
+        interp = json.load(f)
+    return ({band: _from_json(values) for band, values in water_balance['outputs'].items()},
+            {method: _from_json(values) for method, values in interp['methods'].items()})
+
+
+def compare(name, values, golden, precision, band=None):
+    """
+    Compare values with a golden array
+    :param name: str
+        Label for the problem message
+    :param values: np.ndarray
+    :param golden: np.ndarray
+    :param precision: str
+        Key of TOLERANCES
+    :param band: str, optional
+        Band name for per band tolerances
+    :return: str or None
+        Description of the mismatch, or None if values match within tolerance
+    """
+    rtol, atol = BAND_TOLERANCES.get(precision, {}).get(band, TOLERANCES[precision])
+    values = np.asarray(values, dtype=np.float64)
+    if values.shape != golden.shape:
+        return '{}: shape {} does not match golden shape {}'.format(name, values.shape, golden.shape)
+    if not np.array_equal(np.isnan(values), np.isnan(golden)):
+        return '{}: nodata pixels do not match the golden'.format(name)
+    if np.allclose(values, golden, rtol=rtol, atol=atol, equal_nan=True):
+        return None
+    error = np.nanmax(np.abs(values - golden))
+    return '{}: max abs error {:.3g} (rtol {:g}, atol {:g})'.format(name, error, rtol, atol)
+
+
+@pytest.fixture(scope='module')
+def goldens(request):
+    """
+    Golden outputs, regenerated first with --update-goldens
+    """
+    if request.config.getoption('--update-goldens'):
+        update_goldens()
+    return load_goldens()
+
+
+def _call(func, allow_skips, *args):
+    """
+    Run a compute path. Missing dependencies fail the test unless skips are allowed.
+    """
+    try:
+        return func(*args)
+    except ImportError as e:
+        if allow_skips:
+            pytest.skip('missing dependencies: {}'.format(e))
+        pytest.fail('missing dependencies: {} (use --allow-skips to skip)'.format(e))
+
+
+@pytest.mark.parametrize('branch', sorted(BRANCHES))
+def test_goldens_exercise_branch(goldens, branch):
+    assert BRANCHES[branch](goldens[0]), 'synthetic inputs do not exercise: {}'.format(branch)
+
+
+@pytest.mark.parametrize('path', sorted(COMPUTE_PATHS))
+def test_water_balance(goldens, allow_skips, path):
+    precision, water_balance, _ = COMPUTE_PATHS[path]
+    outputs = _call(water_balance, allow_skips, *synthetic_inputs())
+
+    problems = [compare(band, outputs[:, i], goldens[0][band], precision, band)
+                for i, band in enumerate(array_model.OUTPUT_BANDS)]
+    problems = [p for p in problems if p is not None]
+    assert not problems, '\n'.join(problems)
+
+
+@pytest.mark.parametrize('method', sorted(array_model.INTERP_METHODS))
+@pytest.mark.parametrize('path', sorted(name for name, (_, _, interp) in COMPUTE_PATHS.items() if interp))
+def test_interp(goldens, allow_skips, path, method):
+    precision, _, interp = COMPUTE_PATHS[path]
+    values = _call(interp, allow_skips, TARGET_DAYS, SOURCE_DAYS, synthetic_source(), INTERP_DAYS, method)
+
+    problem = compare('interp ' + method, values, goldens[1][method], precision)
+    assert problem is None, problem
@@ -0,0 +1,109 @@
+"""
+Tests of the array resampling: grid mappings, tile windows, and coarse forcing runs through the tiled backends.
+"""
+
+import numpy as np
+import pytest
+
+from VegET import array_model, config, resample
+from test_regression import synthetic_inputs
+
+# Coarse source grid, and a finer target grid that extends past its right and bottom edges
+SRC = resample.Grid(100.0, 2.0, 50.0, -2.0, 5, 7, 'local')
+DST = resample.Grid(100.3, 0.7, 49.8, -0.7, 17, 22, 'local')
+
+
+def _source_values():
+    rng = np.random.default_rng(1)
+    return rng.uniform(0.0, 10.0, (2, 3, SRC.rows, SRC.cols))
+
+
+@pytest.mark.parametrize('method', resample.RESAMPLE_METHODS)
+@pytest.mark.parametrize('rows, cols', [(slice(0, 17), slice(0, 22)), (slice(3, 9), slice(5, 22)),
+                                        (slice(10, 17), slice(0, 4)), (slice(6, 7), slice(8, 9))])
+def test_window_matches_full(method, rows, cols):
+    values = _source_values()
+    mapping = resample.grid_mapping(SRC, DST, method)
+    full = resample.apply_mapping(mapping, values)
+
+    window, src_rows, src_cols = resample.window_mapping(mapping, rows, cols)
+    assert (window.dst.rows, window.dst.cols) == full[..., rows, cols].shape[-2:]
+    np.testing.assert_array_equal(resample.apply_mapping(window, values[..., src_rows, src_cols]),
+                                  full[..., rows, cols])
+
+
+def test_bilinear_reproduces_linear_field():
+    src_x = SRC.x0 + (np.arange(SRC.cols) + 0.5) * SRC.dx
+    src_y = SRC.y0 + (np.arange(SRC.rows) + 0.5) * SRC.dy
+    values = 3.0 + 0.5 * src_x[np.newaxis, :] - 0.25 * src_y[:, np.newaxis]
+    out = resample.resample(values, SRC, DST, 'bilinear')
+
+    x = DST.x0 + (np.arange(DST.cols) + 0.5) * DST.dx
+    y = DST.y0 + (np.arange(DST.rows) + 0.5) * DST.dy
+    expected = 3.0 + 0.5 * x[np.newaxis, :] - 0.25 * y[:, np.newaxis]
+    # Interior: target pixel centers between the first and last source pixel centers
+    interior = ((x >= src_x[0]) & (x <= src_x[-1]))[np.newaxis, :] & \
+               ((y <= src_y[0]) & (y >= src_y[-1]))[:, np.newaxis]
+    assert interior.sum() > 100
+    np.testing.assert_allclose(out[interior], expected[interior], rtol=1e-12)
+
+
+@pytest.mark.parametrize('method', resample.RESAMPLE_METHODS)
+def test_fill_value_outside_grid(method):
+    out = resample.resample(_source_values(), SRC, DST, method, fill_value=-9999.0)
+
+    x = DST.x0 + (np.arange(DST.cols) + 0.5) * DST.dx
+    y = DST.y0 + (np.arange(DST.rows) + 0.5) * DST.dy
+    inside = ((x < SRC.x0 + SRC.cols * SRC.dx)[np.newaxis, :] & (y > SRC.y0 + SRC.rows * SRC.dy)[:, np.newaxis])
+    assert not inside.all()
+    assert np.all(out[..., ~inside] == -9999.0)
+    assert np.all((out[..., inside] >= 0.0) & (out[..., inside] <= 10.0))
+
+
+def _coarse_run(tmp_path, backend, method, auto):
+    """
+    Model inputs with the synthetic forcing on a grid twice as coarse as the model grid, and a run configuration
+    for them
+    :return: tuple (dict, np.ndarray, np.ndarray)
+        Validated configuration, coarse forcing and statics
+    """
+    import zarr
+
+    forcing, statics = synthetic_inputs()
+    # Model grid is 2x finer and one coarse pixel smaller on each side, so bilinear weights vary across tiles
+    statics = np.repeat(np.repeat(statics, 2, axis=1), 2, axis=2)[:, 1:-1, 1:-1]
+    zarr.open_array(str(tmp_path / 'forcing.zarr'), mode='w', shape=forcing.shape, dtype=forcing.dtype)[:] = forcing
+    zarr.open_array(str(tmp_path / 'statics.zarr'), mode='w', shape=statics.shape, dtype=statics.dtype)[:] = statics
+    cfg = config.validate({
+        'dates': {'start': '2020-01-01', 'end': '2020-01-17'},
+        'inputs': {'resample': method},
+        'outputs': {'bands': list(array_model.OUTPUT_BANDS), 'path': str(tmp_path / 'outputs.zarr')},
+        'arrays': {'forcing': str(tmp_path / 'forcing.zarr'), 'statics': str(tmp_path / 'statics.zarr'),
+                   'grid': [1.0, 1.0, -1.0, -1.0], 'forcing_grid': [0.0, 2.0, 0.0, -2.0]},
+        'backend': backend,
+        'tiling': {'tile_size': 3, 'time_chunk': 5, 'auto': auto, 'memory_budget': '256MB' if auto else None},
+        'workers': 2,
+    })
+    return cfg, forcing, statics
+
+
+@pytest.mark.parametrize('auto', [False, True])
+@pytest.mark.parametrize('method', resample.RESAMPLE_METHODS)
+@pytest.mark.parametrize('backend', ['dask', 'shm'])
+def test_coarse_forcing_run(tmp_path, allow_skips, backend, method, auto):
+    try:
+        if backend == 'dask':
+            from VegET import dask_backend as run_backend
+        else:
+            from VegET import shm_executor as run_backend
+        cfg, forcing, statics = _coarse_run(tmp_path, backend, method, auto)
+        outputs = run_backend.run_config(cfg)[:]
+    except ImportError as e:
+        if allow_skips:
+            pytest.skip('missing dependencies: {}'.format(e))
+        pytest.fail('missing dependencies: {} (use --allow-skips to skip)'.format(e))
+
+    src = resample.Grid(0.0, 2.0, 0.0, -2.0, forcing.shape[2], forcing.shape[3], None)
+    dst = resample.Grid(1.0, 1.0, -1.0, -1.0, statics.shape[1], statics.shape[2], None)
+    expected = array_model.vegET_model(resample.resample(forcing, src, dst, method), statics)[0]
+    np.testing.assert_allclose(outputs, expected, rtol=1e-9, atol=1e-9)